@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 """
 Separates each Prem matrix into its own *.csv file, named by ISO-3166 3-letter country code.
+
+Also writes all Prem matrices as a single (countries, 16, 16) tensor "prem_matrices.npy",
+  with its code index and stratum labels in "prem_matrices.json".
 """
 
 # Import libraries
@@ -8,8 +11,14 @@ import argparse
 from sys import exit
 from os.path import exists, isfile
 from os import mkdir
-from json import load
+from json import load, dump
+import numpy as np
 import pandas as pd
+from prem_matrices_to_df_country2code import fn2code_fn
+import sys
+from os.path import abspath, dirname
+sys.path.insert( 0, dirname( dirname( dirname( abspath( __file__ ) ) ) ) ) # Pipeline/ holds instrument.py
+from instrument import add_arguments, instrumented, span
 
 # Prem matrices
 #   https://doi.org/10.1371/journal.pcbi.1005697.s002
@@ -20,86 +29,114 @@ ifn2 = "MUestimates_all_locations_2.json"
 #   https://unstats.un.org/unsd/methodology/m49/overview/UNSD — Methodology.csv
 code_fn = "UNSDMethodology.csv"
 
-# The code depends on a dictionary maintaining order according to insertion.
+# Binary store of all Prem matrices: [store_fbn].npy holds the tensor; [store_fbn].json holds codes and strata.
+store_fbn = "prem_matrices"
 
 def main(): 
     parser = getArguments()
     argument = parser.parse_args()
     check( argument )  
     
+    with instrumented( 'prem_matrices_to_df', argument.trace, argument.profile ):
+        run( argument.idir, argument.odir, csv=not argument.no_csv )
+
+# Returns the Prem matrices, named by code and sorted by code, as { "codeS", "stratumL", "matrix0S" }.
+#   matrix0S is the (countries, 16, 16) float64 tensor. If odir is given, writes the binary store
+#   and (if csv) the [code].csv files.
+def run( idir="../Data/", odir=None, csv=True ): 
+    country2code = country2code_( idir )
+    with span( 'read_prem_json', file=ifn1 ):
+        ( countryS, stratumL, rateS ) = read_prem_json( f'{idir}{ifn1}', headed=True )
+    with span( 'read_prem_json', file=ifn2 ):
+        ( countryS2, stratumL2, rateS2 ) = read_prem_json( f'{idir}{ifn2}', headed=False )
+    assert len( stratumL2 ) == len( stratumL ) # The matrices must be square with the same strata.
+    countryS += countryS2
+    rateS = np.concatenate( ( rateS, rateS2 ) )
+    codeS = []
+    for country in countryS:
+        code = country2code.get( country )
+        if code is None:
+            print( country )
+            code = country
+        codeS.append( code )
+    order = sorted( range( len( codeS ) ), key=lambda i: codeS[ i ] )
+    codeS = [ codeS[ i ] for i in order ]
+    rateS = rateS[ order ]
+    matrix0S = rateS.astype( float )
+    if odir is not None:
+        if not exists( f'{odir}' ):
+            mkdir( f'{odir}' )
+        if csv:
+            with span( 'write_matrix_csvs', items=len( codeS ) ):
+                write_matrix_csvs( odir, codeS, stratumL, rateS )
+        with span( 'write_matrix_store', items=len( codeS ) ):
+            write_matrix_store( f'{odir}{store_fbn}', codeS, stratumL, matrix0S )
+    return { "codeS": codeS, "stratumL": stratumL, "matrix0S": matrix0S }
+
+# Returns the dictionary from Prem country to ISO-3166 3-letter code,
+#   with the ad hoc corrections of prem_matrices_to_df_country2code.py folded in.
+def country2code_( idir ): 
     # Loads UN ISO 3166-1 alpha-3 Country Codes from columns in *.csv file.
     # The UN made errors in columns, so the read needs to specify relevant columns (which are uncorrupted).
     fields = ['Country or Area', 'ISO-alpha3 Code']
-    df = pd.read_csv( f'{argument.idir}{code_fn}', skipinitialspace=True, usecols=fields )
+    df = pd.read_csv( f'{idir}{code_fn}', skipinitialspace=True, usecols=fields )
     country2code = df.set_index('Country or Area').to_dict()['ISO-alpha3 Code']
+    country2code = { country: fn2code_fn.get( code, code ) for ( country, code ) in country2code.items() }
+    for ( country, code ) in fn2code_fn.items():
+        country2code.setdefault( country, code )
+    return country2code
 
-    # Loads input json file with Prem_2017 matrices with headings.
-    with open( f'{argument.idir}{ifn1}' ) as iFH:
-        country2matrix = load( iFH ) # This file contains the strata as headings.
-    init=True
-    for country,matrix in country2matrix.items():
-        if init:
-            stratumS = matrix[0].keys()
-            stratumL = list(stratumS)
-            init=False # Records the stratumS only on the first country.
-        assert len(stratumS) == len(matrix) # The matrix must be square.
-        stratum2rate = dict()
-        for stratum in stratumS:
-            stratum2rate[ stratum ] = []
-        for row in matrix:
-            assert row.keys() == stratumS # The keys for each column must match.
-            for stratum,rate in row.items():
-                stratum2rate[ stratum ].append(rate)
-        df = pd.DataFrame(stratum2rate, index=stratumS)
-        code = country2code.get(country)
-        if code is None:
-            print(country)
-            code = country
-        df.to_csv(f'{argument.odir}{code}.csv')
+# Returns countryS, stratumL and the (countries, 16, 16) array of the rates, as strings, in a Prem json file.
+#   With headed, each row is keyed by the strata; without it, the keys of the first row are the first row of rates
+#   (and the strata are numbered X1, X2, ...).
+def read_prem_json( ifn, headed ): 
+    # Parses each json object as its list of ( key, value ) pairs, keeping their order.
+    with open( ifn ) as iFH:
+        country2matrix = load( iFH, object_pairs_hook=list )
+    countryS = [ country for ( country, matrix ) in country2matrix ]
+    if headed:
+        stratumL = [ stratum for ( stratum, rate ) in country2matrix[ 0 ][ 1 ][ 0 ] ]
+        keyS = [ key for ( country, matrix ) in country2matrix for row in matrix for ( key, rate ) in row ]
+        rateS = [ rate for ( country, matrix ) in country2matrix for row in matrix for ( key, rate ) in row ]
+        n = len( stratumL )
+        assert len( keyS ) == len( countryS ) * n * n # The matrices must be square.
+        assert ( np.array( keyS ).reshape( -1, n ) == np.array( stratumL ) ).all() # The keys for each column must match.
+    else:
+        rateS = [ value for ( country, matrix ) in country2matrix
+                  for value in [ key for ( key, rate ) in matrix[ 0 ] ] + [ rate for row in matrix for ( key, rate ) in row ] ]
+        n = len( country2matrix[ 0 ][ 1 ][ 0 ] )
+        stratumL = [ f'X{i + 1}' for i in range( n ) ]
+        assert len( rateS ) == len( countryS ) * n * n # The matrices must be square and without headings.
+    return countryS, stratumL, np.array( rateS ).reshape( len( countryS ), n, n )
 
-    # Loads input json file with Prem_2017 matrices without headings.
-    with open( f'{argument.idir}{ifn2}' ) as iFH:
-        country2matrix = load( iFH ) # This file contains the strata as headings.
-    for country,matrix in country2matrix.items():
-        assert len(stratumS) - 1 == len(matrix) # The matrix must be square and without headings.
-        stratum2rate = dict()
-        for stratum in stratumS:
-            stratum2rate[ stratum ] = []
-        init=True
-        for row in matrix:
-            rateS = row.keys()
-            assert len(stratumS) == len( rateS )
-            j = 0
-            for stratum,rate in row.items():
-                if init:
-                    i = 0
-                    for stratum in row.keys():
-                        stratum2rate[ stratumL[ i ] ].append(stratum)
-                        i += 1
-                init=False
-                stratum2rate[ stratumL[ j ] ].append(rate)
-                j += 1
-        df = pd.DataFrame(stratum2rate, index=stratumS)
-        code = country2code.get(country)
-        if code is None:
-            print(country)
-            code = country
-        df.to_csv(f'{argument.odir}{code}.csv')
+# Writes each Prem matrix to [code].csv in odir, with the strata labelling rows and columns and the rates as in the json files.
+def write_matrix_csvs( odir, codeS, stratumL, rateS ): 
+    header = ',' + ','.join( stratumL ) + '\n'
+    for ( code, rate2S ) in zip( codeS, rateS ):
+        with open( f'{odir}{code}.csv', 'w' ) as oFH:
+            oFH.write( header )
+            oFH.writelines( f'{stratum},' + ','.join( rowS ) + '\n' for ( stratum, rowS ) in zip( stratumL, rate2S.tolist() ) )
+
+# Writes the Prem matrices as one memory-mappable *.npy tensor and a *.json index of codes and strata.
+def write_matrix_store( ofbn, codeS, stratumL, matrixS ):
+    np.save( f'{ofbn}.npy', np.asarray( matrixS, dtype=float ) )
+    with open( f'{ofbn}.json', 'w' ) as oFH:
+        dump( { "codes": codeS, "strata": stratumL }, oFH, indent=4 )
 
 # Check and fixes arguments if possible.    
 def check( argument ): 
     if not exists( f'{argument.idir}' ):
         print( f'Error: a valid INPUT_DIRECTORY "{argument.idir}" is required.' )
-        exit
+        exit(1)
     if not isfile( f'{argument.idir}{ifn1}' ):
         print( f'Error: a valid INPUT_JSON_PREM_MATRICES "{argument.idir}{ifn1}" is required.' )
-        exit
+        exit(1)
     if not isfile( f'{argument.idir}{ifn2}' ):
         print( f'Error: a valid INPUT_JSON_PREM_MATRICES "{argument.idir}{ifn2}" is required.' )
-        exit
+        exit(1)
     if not isfile( f'{argument.idir}{code_fn}' ):
         print( f'Error: a valid INPUT_CSV_COUNTRY2CODE "{argument.idir}{code_fn}" is required.' )
-        exit
+        exit(1)
     if not exists( f'{argument.odir}' ):
         mkdir( f'{argument.odir}' )
     
@@ -109,6 +146,9 @@ def getArguments():
                         help="INPUT_DIRECTORY", metavar="INPUT_DIRECTORY")
     parser.add_argument("-o", "--odir", dest="odir", default="../Output/", # input directory
                         help="OUTPUT_DIRECTORY", metavar="OUTPUT_DIRECTORY")
+    parser.add_argument("--no_csv", dest="no_csv", action="store_true", # writes only the binary store, not the [code].csv files
+                        help="NO_CSV")
+    add_arguments( parser )
     return parser
     
 if __name__ == "__main__":
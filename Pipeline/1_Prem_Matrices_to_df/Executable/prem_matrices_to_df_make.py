@@ -1,11 +1,10 @@
 #!/usr/bin/env python
 
-from os import system
+from sys import exit
+from os import system, waitstatus_to_exitcode
 
 log = f'prem_matrices_to_df.log'
 
-system( f'python prem_matrices_to_df.py > {log}' )
-
 # Not all Prem countries correspond to ISO-3166 3-letter country names.
-# Occasional differences require ad hoc correction.
-system( f'python prem_matrices_to_df_country2code.py >> {log}' ) 
+# The ad hoc corrections in prem_matrices_to_df_country2code.py are applied as the matrices are read.
+exit( waitstatus_to_exitcode( system( f'python prem_matrices_to_df.py > {log}' ) ) )
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Asymptotic regime regression in NumPy, reproducing the output of 'arrp.exe -include left'.
+
+The regression fits f(x) ~ beta0 + beta1*x by weighted least squares on the range [0,k],
+  where k minimizes chi-square(0..k) - c*c*(k+1), i.e., each point in the regime
+  contributes less than c standard deviations on average.
+"""
+
+# Import libraries
+import numpy as np
+from scipy.stats import chi2 as chi2_distribution
+
+C = 2.0 # standard deviations per point in arrp.exe
+ALPHA = 0.05 # significance of the chi-square goodness of fit for the criterion "pvalue"
+CRITERIA = [ "arrp", "pvalue", "segmented" ]
+
+# Returns the asymptotic regression of the points (x,y,error) whose regime includes the left end.
+#   criterion selects the end of the regime as in breakpoint_profile_(); "arrp" reproduces arrp.exe.
+def arrp_( x, y, error, c=C, criterion="arrp", alpha=ALPHA ):
+    profile = breakpoint_profile_( x, y, error, criterion, c, alpha )
+    k = profile[ "k" ]
+    weightS = np.zeros( len( profile[ "score" ] ), dtype=int )
+    weightS[ :k + 1 ] = 1
+    return { "range": ( 0, k ),
+             "beta0": float( profile[ "beta0" ][ k ] ), "beta0_error": float( profile[ "beta0_error" ][ k ] ),
+             "beta1": float( profile[ "beta1" ][ k ] ), "beta1_error": float( profile[ "beta1_error" ][ k ] ),
+             "weightS": weightS }
+
+# Returns the score profile of every candidate regime [0,k] of the points (x,y,error) from prefix sums, i.e., in O(n):
+#   arrays "beta0", "beta0_error", "beta1", "beta1_error", "chi2" and "score" indexed by k, and the "k" minimizing "score".
+#   criterion "arrp" scores chi-square(0..k) - c*c*(k+1), as arrp.exe;
+#   "pvalue" scores -(k+1) while the chi-square goodness of fit of [0,k] has a p-value of at least alpha, else +inf,
+#     i.e., selects the longest range consistent with a line;
+#   "segmented" scores chi-square(0..k) + chi-square(k+1..n-1), i.e., selects the breakpoint of a two-line fit.
+def breakpoint_profile_( x, y, error, criterion="arrp", c=C, alpha=ALPHA ):
+    x = np.asarray( x, dtype=float )
+    y = np.asarray( y, dtype=float )
+    error = np.asarray( error, dtype=float )
+    if len( x ) < 2:
+        raise ValueError( 'arrp needs at least 2 points to regress.' )
+    # Prefix sums of the weighted least-squares sufficient statistics for every range [0,k].
+    w = 1.0 / ( error * error )
+    sumS = [ np.cumsum( v ) for v in ( w, w * x, w * y, w * x * x, w * x * y, w * y * y ) ]
+    profile = line_fits_( *sumS )
+    chi2 = profile[ "chi2" ]
+    chi2[ 0 ] = np.nan # A single point has no regression.
+    chi2[ 1 ] = 0.0 # Two points lie on their line.
+    n = np.arange( 1, len( x ) + 1 )
+    if criterion == 'arrp':
+        score = chi2 - c * c * n
+    elif criterion == 'pvalue':
+        pvalue = np.ones( len( x ) )
+        pvalue[ 2: ] = chi2_distribution.sf( chi2[ 2: ], n[ 2: ] - 2 )
+        score = np.where( pvalue >= alpha, -n.astype( float ), np.inf )
+        score[ 0 ] = np.nan
+    elif criterion == 'segmented':
+        # Suffix sums for every range [k+1,n-1] are the totals less the prefix sums.
+        right = line_fits_( *[ v[ -1 ] - v for v in sumS ] )[ "chi2" ]
+        right[ n[ ::-1 ] - 1 <= 2 ] = 0.0 # 0, 1 or 2 points lie on their line.
+        score = chi2 + right
+    else:
+        raise ValueError( f'Unknown criterion "{criterion}"; use one of {CRITERIA}.' )
+    return dict( profile, score=score, k=int( np.nanargmin( score ) ) )
+
+# Returns the weighted least-squares lines (and chi-squares) for arrays of sums s, sx, sy, sxx, sxy, syy.
+def line_fits_( s, sx, sy, sxx, sxy, syy ):
+    with np.errstate( divide='ignore', invalid='ignore' ):
+        determinant = s * sxx - sx * sx
+        beta1 = ( s * sxy - sx * sy ) / determinant
+        beta0 = ( sxx * sy - sx * sxy ) / determinant
+        chi2 = syy - beta0 * sy - beta1 * sxy
+        return { "beta0": beta0, "beta0_error": np.sqrt( sxx / determinant ),
+                 "beta1": beta1, "beta1_error": np.sqrt( s / determinant ), "chi2": chi2 }
+
+# Writes the arrp.exe output file ofn for the input file ifn.
+def write_arrp_out_( ofn, ifn, x, y, error, arrpout, c=C ):
+    with open( ofn, 'w' ) as oFH:
+        oFH.write( f'Input\t{ifn}\n' )
+        oFH.write( 'Flat\tno\tResult\tf(y)~beta0+beta1*y\n' )
+        oFH.write( f'Regression\tasymptotic\tc\t{c:g}\tInclude\tleft\n' )
+        oFH.write( 'Range\t%d\t%d\n' % arrpout[ "range" ] )
+        oFH.write( 'beta0\t%g\terror\t%g\n' % ( arrpout[ "beta0" ], arrpout[ "beta0_error" ] ) )
+        oFH.write( 'beta1\t%g\terror\t%g\n' % ( arrpout[ "beta1" ], arrpout[ "beta1_error" ] ) )
+        oFH.write( '\n' )
+        oFH.write( 'X\tY\tError\tWeight\n' )
+        for ( xi, yi, ei, wi ) in zip( x, y, error, arrpout[ "weightS" ] ):
+            oFH.write( '%g\t%g\t%g\t%d\n' % ( xi, yi, ei, wi ) )
+
+# Returns the regression from the arrp.exe output file ifn.
+def read_arrp_out_( ifn ):
+    with open( ifn ) as iFH:
+        lines = iFH.readlines()
+    arrpout = dict()
+    weightS = []
+    in_points = False
+    for line in lines:
+        fieldS = line.split() # Splits on whitespace.
+        if not fieldS:
+            continue
+        if in_points:
+            weightS.append( int( fieldS[ 3 ] ) )
+        elif fieldS[ 0 ] == 'Range':
+            arrpout[ "range" ] = ( int( fieldS[ 1 ] ), int( fieldS[ 2 ] ) )
+        elif fieldS[ 0 ] in ( 'beta0', 'beta1' ):
+            arrpout[ fieldS[ 0 ] ] = float( fieldS[ 1 ] )
+            arrpout[ f'{fieldS[ 0 ]}_error' ] = float( fieldS[ 3 ] )
+        elif fieldS[ 0 ] == 'X':
+            in_points = True
+    arrpout[ "weightS" ] = np.array( weightS, dtype=int )
+    return arrpout
@@ -7,157 +7,487 @@ The OWID json file contains 3-letter country codes and its own locations.
 
 # Import libraries
 import argparse
+from argparse import Namespace
+import sys
 from sys import exit
-from os import system, mkdir
-from os.path import exists, isfile
-from pandas import DataFrame
+from os import system, mkdir, remove, getpid
+from os.path import exists, isfile, abspath, dirname
+from pandas import DataFrame, concat
 import datetime
-import math
+import csv
+import numpy as np
 from time import time
-from json import load
+from json import load, loads, dump, dumps
+from hashlib import sha256
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from arrp import arrp_, breakpoint_profile_, write_arrp_out_, read_arrp_out_, CRITERIA
+from arrp_countries_owid import owid_countries_, owid_columns_, owid_cache_countries_
+from arrp_countries_rolling import rolling_slopes_
+from arrp_countries_resample import resample_
+from arrp_countries_sweep import SWEEP_NAMES, sweep_configurations, owid_columns_once_, map_shared_
+from arrp_countries_long import long_series_
+from arrp_countries_store import open_store_, write_fit_, export_text_
+sys.path.insert( 0, dirname( dirname( dirname( abspath( __file__ ) ) ) ) ) # Pipeline/ holds instrument.py
+from instrument import add_arguments, instrumented, span, record, peak_rss
 
 ofbn = 'slope'
 
+POINT_DTYPE = np.dtype( [ ( "x", np.int64 ), ( "y", np.float64 ), ( "error", np.float64 ) ] )
+
 def main(): 
     parser = getArguments()
     argument = parser.parse_args()
     check( argument )  
-    
-    # Loads OWID COVID-19 json file.
+    with instrumented( 'arrp_countries', argument.trace, argument.profile ):
+        if argument.export:
+            codeS = export_text_( f'{argument.odir}{argument.store}', f'{argument.odir}{argument.cdir}' )
+            print( f'-- Exported {len( codeS )} countries from "{argument.odir}{argument.store}" --', flush=True )
+        elif argument.sweep:
+            sweep_( argument )
+        elif argument.long_fn:
+            long_( argument )
+        else:
+            slope_( argument )
+
+# Returns { "slope": DataFrame as slope.csv, "rolling": DataFrame as slope_rolling.csv or None,
+#   "profile": DataFrame of every country's Countries/[code]_score.csv or None },
+#   or with sweep, { "sweep": DataFrame as slope_sweep.csv }, or with long_fn, as long_().
+#   Keywords override the defaults of the command-line arguments (by dest);
+#   without odir, the python engine regresses in memory and no file is written.
+def run( idir="../Data", odir=None, engine="python", **name2value ): 
+    argument = getArguments().parse_args( [] )
+    for ( name, value ) in dict( name2value, idir=idir, odir=odir, engine=engine ).items():
+        if not hasattr( argument, name ):
+            raise TypeError( f'run() got an unexpected argument "{name}".' )
+        setattr( argument, name, value )
+    if odir is None:
+        if engine != 'python':
+            raise ValueError( 'arrp.exe needs an OUTPUT_DIRECTORY for its files.' )
+        argument.no_cache = True
+    check_( argument )
+    if argument.sweep:
+        return sweep_( argument )
+    if argument.long_fn:
+        return long_( argument )
+    return slope_( argument )
+
+# Extracts and regresses every country; writes slope.csv (and slope_rolling.csv) if argument.odir is not None.
+def slope_( argument ): 
+    # Streams OWID COVID-19 json file one country at a time, extracting and regressing each country.
     start = time()
     print( f'-- Reading "{argument.json_file}" started --', flush=True )
-    with open( f'{argument.idir}{argument.json_file}' ) as iFH:
-        code2data = load( iFH )
+    countryS = owid_countryS_( argument, [ argument.datum_for_threshold, argument.new_cases ] )
+    code2cache = dict()
+    if not argument.no_cache and argument.odir is not None and isfile( f'{argument.odir}{ofbn}_cache.json' ):
+        with open( f'{argument.odir}{ofbn}_cache.json' ) as iFH:
+            code2cache = load( iFH )
+    with span( 'read_and_fit', jobs=argument.jobs ):
+        ( code2country, code2fit ) = code2country_( countryS, argument, code2cache )
     print( f'-- Reading "{argument.json_file}" ended --', flush=True )
     print( f'-- Elapsed time { int( time() - start ) } secs --', flush=True )
-    code2country = code2country_( code2data )
-    print( f'-- Writing "{argument.odir}code2country.json" ended --', flush=True )
-    print( f'-- Elapsed time { int( time() - start ) } secs --', flush=True )
-    # Writes asymptotic regression data, output, and summary files.
+    # Writes asymptotic regression summary in sorted-code order, whatever order the fits finished.
     colS = [ 'code', 'country', 'slope', 'error', 'number_of_points', 'start_date', 'end_date' ]
-    index = 0
+    resample_colS = resample_cols_( argument )
     head2arrpout = dict()
-    for col in colS:
+    for col in colS + resample_colS:
         head2arrpout[ col ] = []
     print( f'-- Writing regression files started --', flush=True )
     codeS = sorted( code2country.keys() ) # OWID country codes
+    ( connection, run_id ) = store_( argument )
     for code in codeS:
         print( f'-- "{code2country[ code ]}" started --', flush=True )
-        oFBC = f'{argument.odir}{argument.cdir}{code}' # basename of output files for code
-        name2data = name2data_( argument, code, code2data )
-        pointS = name2data[ "pointS" ]
-        startDashDate = name2data[ "startDashDate" ]
-        if len( pointS ) < 2:
-             print( f'-- arrp needs at least 2 points to regress --', flush=True )
-        else:   
-            with open( f'{oFBC}.dat', 'w' ) as oFH:
-                for point in pointS:
-                    oFH.write( "%d\t%f\t%f\n" % ( point["x"], point["y"], point["error"] ) )
-            try:
-                system( f'arrp.exe -in {oFBC}.dat -out {oFBC}.out -include left 1> /dev/null 2> /dev/null' )
-            except:
-                print( f'-- "{code2country[ code ]}" arrp threw an error --', flush=True )
-        if isfile( f'{oFBC}.out' ):
-            addTo_head2arrpout_( head2arrpout, colS, code, code2country[ code ], startDashDate, f'{oFBC}.out' )
-        index += 1
-            # addTo_head2arrpout_( code, code2country[ code ], head2arrpout, startDashDate, f'{oFBC}.out' )
-        print( f'-- Elapsed time { int( time() - start ) } secs --', flush=True )
+        fit = code2fit[ code ]
+        # Records the extraction and regression of the country, timed in the process that ran it.
+        record( 'fit', fit[ "start" ], fit[ "seconds" ], pid=fit[ "pid" ], peak_rss=fit[ "peak_rss" ], items=1, code=code, points=len( fit[ "name2data" ][ "pointS" ] ) )
+        for message in fit[ "messageS" ]:
+            print( message, flush=True )
+        if connection is not None and len( fit[ "name2data" ][ "pointS" ] ) >= 2:
+            write_fit_( connection, run_id, code, code2country[ code ], fit[ "name2data" ][ "startDashDate" ], fit[ "name2data" ][ "pointS" ], fit[ "arrpout" ] )
+        if fit[ "arrpout" ] is not None:
+            addTo_head2arrpout_( head2arrpout, colS, code, code2country[ code ], fit[ "name2data" ][ "startDashDate" ], fit[ "arrpout" ] )
+            for col in resample_colS:
+                head2arrpout[ col ].append( str( fit[ "resample" ][ col ] ) )
+    if connection is not None:
+        connection.commit()
+        connection.close()
     print( f'-- Writing regression files ended --', flush=True )
     print( f'-- Elapsed time { int( time() - start ) } secs --', flush=True )
     # csv output 
-    df = DataFrame(head2arrpout, columns=colS)
-    df.to_csv(f'{argument.odir}{ofbn}.csv', index = False)      
+    df = DataFrame(head2arrpout, columns=colS + resample_colS)
+    df_rolling = None
+    if argument.window > 0:
+        # Concatenates the rolling-window time series, whose columns match slope.csv for step 4.
+        dfS = [ code2fit[ code ][ "rolling" ] for code in codeS if code2fit[ code ][ "rolling" ] is not None ]
+        df_rolling = concat( dfS, ignore_index=True ) if dfS else DataFrame( columns=colS )
+    if argument.odir is not None:
+        df.to_csv(f'{argument.odir}{ofbn}.csv', index = False)      
+        # Records the regressions, so the next run refits only the countries whose points moved.
+        code2cache = { code: code2fit[ code ][ "cache" ] for code in codeS if code2fit[ code ][ "cache" ] is not None }
+        with open( f'{argument.odir}{ofbn}_cache.json', 'w' ) as oFH:
+            dump( code2cache, oFH, sort_keys=True )
+        if df_rolling is not None:
+            df_rolling.to_csv( f'{argument.odir}{ofbn}_rolling.csv', index = False )
     # https://stackoverflow.com/questions/18695605/python-pandas-dataframe-to-dictionary  
+    # The columns hold strings as written; the returned frame has the types read back from slope.csv.
+    df = df.astype( dict( { 'slope': float, 'error': float, 'number_of_points': int }, **{ col: float for col in resample_colS } ) )
+    df_profile = None
+    if argument.score_profile:
+        dfS = [ code2fit[ code ][ "profile" ] for code in codeS if code2fit[ code ][ "profile" ] is not None ]
+        df_profile = concat( dfS, ignore_index=True ) if dfS else None
+    return { "slope": df, "rolling": df_rolling, "profile": df_profile }
+
+# Regresses every series of the long-format file argument.long_fn, appending its rows to slope.csv (and slope_rolling.csv)
+#   as soon as it is fit, in file order; returns { "slope": DataFrame as slope.csv, "series": number of series read }.
+#   With argument.odir, "slope" is None: the rows are only written, so memory is bounded by a chunk of the file
+#   and the series in flight, whatever the number of series. The regression cache is not used.
+def long_( argument ): 
+    start = time()
+    print( f'-- Reading "{argument.long_fn}" started --', flush=True )
+    seriesS = long_series_( argument.long_fn, argument.key_column, argument.date_column,
+                            [ argument.datum_for_threshold, argument.new_cases ], argument.location_column )
+    colS = [ 'code', 'country', 'slope', 'error', 'number_of_points', 'start_date', 'end_date' ]
+    resample_colS = resample_cols_( argument )
+    rowS = []
+    oFH = None
+    if argument.odir is not None:
+        oFH = open( f'{argument.odir}{ofbn}.csv', 'w', newline='' )
+        writer = csv.writer( oFH, lineterminator='\n' )
+        writer.writerow( colS + resample_colS )
+        rolling_fn = f'{argument.odir}{ofbn}_rolling.csv'
+        if isfile( rolling_fn ):
+            remove( rolling_fn )
+    count = 0
+    ( connection, run_id ) = store_( argument )
+    with span( 'read_and_fit', jobs=argument.jobs ):
+        for ( code, country, fit ) in fits_( seriesS, argument ):
+            count += 1
+            print( f'-- "{country}" started --', flush=True )
+            record( 'fit', fit[ "start" ], fit[ "seconds" ], pid=fit[ "pid" ], peak_rss=fit[ "peak_rss" ], items=1, code=code, points=len( fit[ "name2data" ][ "pointS" ] ) )
+            for message in fit[ "messageS" ]:
+                print( message, flush=True )
+            if connection is not None and len( fit[ "name2data" ][ "pointS" ] ) >= 2:
+                write_fit_( connection, run_id, code, country, fit[ "name2data" ][ "startDashDate" ], fit[ "name2data" ][ "pointS" ], fit[ "arrpout" ] )
+            if fit[ "arrpout" ] is not None:
+                head2arrpout = { col: [] for col in colS }
+                addTo_head2arrpout_( head2arrpout, colS, code, country, fit[ "name2data" ][ "startDashDate" ], fit[ "arrpout" ] )
+                row = [ head2arrpout[ col ][ 0 ] for col in colS ] + [ str( fit[ "resample" ][ col ] ) for col in resample_colS ]
+                if oFH is not None:
+                    writer.writerow( row )
+                else:
+                    rowS.append( row )
+            if oFH is not None and fit[ "rolling" ] is not None:
+                fit[ "rolling" ].to_csv( rolling_fn, mode='a', header=not isfile( rolling_fn ), index = False )
+    if oFH is not None:
+        oFH.close()
+    if connection is not None:
+        connection.commit()
+        connection.close()
+    print( f'-- Reading "{argument.long_fn}" ended: {count} series --', flush=True )
+    print( f'-- Elapsed time { int( time() - start ) } secs --', flush=True )
+    if oFH is not None:
+        return { "slope": None, "series": count }
+    df = DataFrame( rowS, columns=colS + resample_colS )
+    df = df.astype( dict( { 'slope': float, 'error': float, 'number_of_points': int }, **{ col: float for col in resample_colS } ) )
+    return { "slope": df, "series": count }
+
+# Returns ( connection, run_id ) of a new run in the artifact store argument.store in the output directory,
+#   or ( None, None ) without a store.
+def store_( argument ): 
+    if argument.store is None or argument.odir is None:
+        return None, None
+    parameters = { name: getattr( argument, name ) for name in [ "threshold", "datum_for_threshold", "new_cases", "st_dev_factor", "engine", "criterion", "alpha" ] }
+    parameters[ "source" ] = argument.long_fn if argument.long_fn else f'{argument.idir}{argument.json_file}'
+    return open_store_( f'{argument.odir}{argument.store}', parameters )
+
+# Yields ( code, country, timed_fit_( ... ) ) for each series in the stream seriesS, in stream order,
+#   fitting in a process pool if argument.jobs > 1 with at most 2*jobs series in flight.
+def fits_( seriesS, argument ): 
+    if argument.jobs <= 1:
+        for ( code, country, dataS ) in seriesS:
+            yield code, country, timed_fit_( argument, code, country, dataS )
+        return
+    with ProcessPoolExecutor( max_workers=argument.jobs ) as executor:
+        futureS = deque()
+        for ( code, country, dataS ) in seriesS:
+            if len( futureS ) >= 2 * argument.jobs:
+                ( code0, country0, future ) = futureS.popleft()
+                yield code0, country0, future.result()
+            futureS.append( ( code, country, executor.submit( timed_fit_, argument, code, country, dataS ) ) )
+        while futureS:
+            ( code0, country0, future ) = futureS.popleft()
+            yield code0, country0, future.result()
+
+# Regresses every country under every configuration of the grid argument.sweep with the python engine;
+#   writes slope_sweep.csv if argument.odir is not None.
+#   The OWID json file is read once, and the configurations of a country are fit in one task of the pool.
+def sweep_( argument ): 
+    configurationS = sweep_configurations( argument.sweep, argument )
+    argumentS = [ Namespace( **dict( vars( argument ), **configuration ) ) for configuration in configurationS ]
+    nameS = sorted( set( name for configuration in configurationS for name in ( configuration[ "datum_for_threshold" ], configuration[ "new_cases" ] ) ) )
+    start = time()
+    print( f'-- Reading "{argument.json_file}" started --', flush=True )
+    with span( 'read_columns', columns=len( nameS ) ):
+        ( code2country, code2columns ) = owid_columns_once_( owid_countryS_( argument, nameS ), nameS )
+    print( f'-- Reading "{argument.json_file}" ended --', flush=True )
+    print( f'-- Elapsed time { int( time() - start ) } secs --', flush=True )
+    codeS = sorted( code2country.keys() ) # OWID country codes
+    print( f'-- Regressing {len( configurationS )} configurations x {len( codeS )} countries started --', flush=True )
+    with span( 'sweep', items=len( configurationS ) * len( codeS ), jobs=argument.jobs ):
+        rowSS = map_shared_( partial( sweep_fit_, argumentS ), codeS, { code: ( code2country[ code ], code2columns[ code ] ) for code in codeS }, argument.jobs )
+    print( f'-- Elapsed time { int( time() - start ) } secs --', flush=True )
+    # Orders the rows by configuration, then code.
+    colS = [ 'configuration' ] + list( configurationS[ 0 ] ) + [ 'code', 'country', 'slope', 'error', 'number_of_points', 'start_date', 'end_date' ]
+    rowS = sorted( ( row for rowS in rowSS for row in rowS ), key=lambda row: row[ 0 ] )
+    df = DataFrame( rowS, columns=colS )
+    if argument.odir is not None:
+        df.to_csv( f'{argument.odir}{ofbn}_sweep.csv', index = False )
+    df = df.astype( { 'slope': float, 'error': float, 'number_of_points': int } )
+    return { "sweep": df }
 
-# Adds a line to outS from the arrp output file.    
-def addTo_head2arrpout_( head2arrpout, colS, code, country, startDashDate, iFC ): 
-    with open( iFC ) as iFH: # Runs if regression succeeds.
-        lines = iFH.readlines()
-        line = lines.pop(0)
-        while lines and not line.startswith( 'beta1' ):
-            line = lines.pop(0)
-        line.rstrip()
-        fieldS = line.split() # Splits on whitespace.
-        value = { "slope": float( fieldS[ 1 ] ), "error": float( fieldS[ 3 ] ) }
-        while lines and not line.startswith( "X" ):
-           line = lines.pop(0)
-        line.rstrip()
-        numberPoints = 0
-        weight = '1'
-        while lines and weight == '1':
-            line = lines.pop(0)
-            line.rstrip()
-            fieldS = line.split() # Splits on whitespace.
-            weight = fieldS[ 3 ]
-            if weight == '1':
-                numberPoints += 1
-        endDate = datetime.datetime.strptime( startDashDate, "%Y-%m-%d" ).date() + datetime.timedelta( days = numberPoints - 1 )
-        endDashDate = endDate.strftime( "%Y-%m-%d" )
-        # Constructs the fieldS.
-        #     colS = [ 'index', 'code', 'country', 'slope', 'error', 'number_of_points', 'start_date', 'end_date' ]
-        headS = list(colS)
-        head2arrpout[ headS.pop(0) ].append(str(code))
-        head2arrpout[ headS.pop(0) ].append(str(country))
-        head2arrpout[ headS.pop(0) ].append(str(value[ "slope" ]))
-        head2arrpout[ headS.pop(0) ].append(str(value[ "error" ]))
-        head2arrpout[ headS.pop(0) ].append(str(numberPoints))
-        head2arrpout[ headS.pop(0) ].append(str(startDashDate))
-        head2arrpout[ headS.pop(0) ].append(str(endDashDate))
-        assert not headS
+# Returns the rows of slope_sweep.csv for one country, one per configuration in argumentS that regresses;
+#   item is ( country, column2array ).
+def sweep_fit_( argumentS, code, item ): 
+    ( country, column2array ) = item
+    colS = [ 'code', 'country', 'slope', 'error', 'number_of_points', 'start_date', 'end_date' ]
+    rowS = []
+    for ( i, argument ) in enumerate( argumentS ):
+        name2data = points_( argument, column2array )
+        pointS = name2data[ "pointS" ]
+        if len( pointS ) < 2:
+            continue
+        arrpout = arrp_( pointS[ "x" ], pointS[ "y" ], pointS[ "error" ], criterion=argument.criterion, alpha=argument.alpha )
+        if arrpout is None:
+            continue
+        head2arrpout = { col: [] for col in colS }
+        addTo_head2arrpout_( head2arrpout, colS, code, country, name2data[ "startDashDate" ], arrpout )
+        rowS.append( tuple( [ i ] + [ getattr( argument, name ) for name in SWEEP_NAMES ] + [ head2arrpout[ col ][ 0 ] for col in colS ] ) )
+    return rowS
+
+# Returns the stream of ( code, country, dataS ) from the OWID json file,
+#   or with argument.cache_dir, of ( code, country, columns ) from its columnar cache holding the columns nameS.
+def owid_countryS_( argument, nameS ): 
+    if argument.cache_dir is not None:
+        return owid_cache_countries_( f'{argument.idir}{argument.json_file}', argument.cache_dir, nameS )
+    return owid_countries_( f'{argument.idir}{argument.json_file}' )
+
+# Adds a line to outS from the arrp regression.    
+def addTo_head2arrpout_( head2arrpout, colS, code, country, startDashDate, arrpout ): 
+    value = { "slope": arrpout[ "beta1" ], "error": arrpout[ "beta1_error" ] }
+    numberPoints = number_of_points_( arrpout )
+    endDate = datetime.datetime.strptime( startDashDate, "%Y-%m-%d" ).date() + datetime.timedelta( days = numberPoints - 1 )
+    endDashDate = endDate.strftime( "%Y-%m-%d" )
+    # Constructs the fieldS.
+    #     colS = [ 'index', 'code', 'country', 'slope', 'error', 'number_of_points', 'start_date', 'end_date' ]
+    headS = list(colS)
+    head2arrpout[ headS.pop(0) ].append(str(code))
+    head2arrpout[ headS.pop(0) ].append(str(country))
+    head2arrpout[ headS.pop(0) ].append(str(value[ "slope" ]))
+    head2arrpout[ headS.pop(0) ].append(str(value[ "error" ]))
+    head2arrpout[ headS.pop(0) ].append(str(numberPoints))
+    head2arrpout[ headS.pop(0) ].append(str(startDashDate))
+    head2arrpout[ headS.pop(0) ].append(str(endDashDate))
+    assert not headS
     
-# Returns points for COVID-19 ARRP input file.    
-def name2data_( argument, code, code2data ): 
+# Returns the number of points in the initial phase that arrp regressed, from the end of its range.    
+def number_of_points_( arrpout ): 
+    return arrpout[ "range" ][ 1 ] + 1
+
+# Returns the resampling columns of slope.csv: bootstrap quantiles "slope_q[quantile]", then "jackknife_error".    
+def resample_cols_( argument ): 
+    colS = [ f'slope_q{q:g}' for q in loads( argument.quantiles ) ] if argument.bootstrap > 0 else []
+    return colS + ( [ 'jackknife_error' ] if argument.jackknife else [] )
+
+# Returns points for COVID-19 ARRP input file as a structured array with fields x, y, error.    
+def name2data_( argument, dataS ): 
+    return points_( argument, owid_columns_( dataS, [ argument.datum_for_threshold, argument.new_cases ] ) )
+
+# Returns points for COVID-19 ARRP input file from the columns of owid_columns_().    
+def points_( argument, column2array ): 
     DATUM_FOR_THRESHOLD = argument.datum_for_threshold
     THRESHOLD = argument.threshold
     NEW_CASES = argument.new_cases
     ST_DEV_FACTOR = argument.st_dev_factor
 
-    pointS = []
-    startDashDate = ""
-    for datum in code2data[ code ][ "data" ]:
-        # Starts pointS whe total cases = THRESHOLD. NYT uses 100 new cases.
-        if not startDashDate:
-            if DATUM_FOR_THRESHOLD in datum and THRESHOLD <= datum[ DATUM_FOR_THRESHOLD ]:
-                startDashDate = datum[ "date" ]
-                startDate = datetime.datetime.strptime( startDashDate, "%Y-%m-%d" ).date()
-            else:
-                continue
-        # DATUM_FOR_THRESHOLD has exceeded THRESHOLD.
-        nextNewCases = datum[ NEW_CASES ]
-        # Stops if 0,1 new cases on the next day.
-        if nextNewCases <= 1.0: 
-            break
-        # Appends the points for asymptotic regression to the list.
-        nextDashDate = datum[ "date" ]
-        nextDate = datetime.datetime.strptime( nextDashDate, "%Y-%m-%d" ).date()
-        x = (nextDate - startDate).days # days after 2019-12-31
-        y = math.log( nextNewCases ) # linear for the initial exponential rise
-        # Multiplies the error by a factor to compensate for smoothing (if any).
-        error = math.pow( y, -0.5 ) * ST_DEV_FACTOR # Poisson error based on the same day
-        point = {"x": x, "y": y, "error": error }
-        pointS.append( point )
-    return { "pointS": pointS, "startDashDate": startDashDate }
+    dateS = column2array[ "date" ]
+    # Starts pointS when DATUM_FOR_THRESHOLD first reaches THRESHOLD. NYT uses 100 new cases.
+    startS = np.flatnonzero( THRESHOLD <= column2array[ DATUM_FOR_THRESHOLD ] )
+    if len( startS ) == 0:
+        return { "pointS": np.zeros( 0, dtype=POINT_DTYPE ), "startDashDate": "" }
+    start = startS[ 0 ]
+    # Stops before the first day with 0,1 new cases (or no data).
+    newCaseS = column2array[ NEW_CASES ][ start: ]
+    stopS = np.flatnonzero( ~( newCaseS > 1.0 ) )
+    stop = stopS[ 0 ] if len( stopS ) else len( newCaseS )
+    pointS = np.empty( stop, dtype=POINT_DTYPE )
+    pointS[ "x" ] = ( dateS[ start:start + stop ] - dateS[ start ] ).astype( np.int64 ) # days after the start date
+    pointS[ "y" ] = np.log( newCaseS[ :stop ] ) # linear for the initial exponential rise
+    # Multiplies the error by a factor to compensate for smoothing (if any).
+    pointS[ "error" ] = pointS[ "y" ] ** -0.5 * ST_DEV_FACTOR # Poisson error based on the same day
+    return { "pointS": pointS, "startDashDate": str( dateS[ start ] ) }
+
+# Returns the rolling-window regressions over the whole series of one country as a DataFrame with the columns of slope.csv.
+#   A window with WINDOW days ends every STRIDE days; start_date and end_date bound the window.
+def rolling_( argument, code, country, dataS ): 
+    NEW_CASES = argument.new_cases
+    ST_DEV_FACTOR = argument.st_dev_factor
+
+    column2array = owid_columns_( dataS, [ NEW_CASES ] )
+    dateS = column2array[ "date" ]
+    newCaseS = column2array[ NEW_CASES ]
+    # Keeps days with more than 1 new case, as for the initial slope.
+    keep = newCaseS > 1.0
+    x = ( dateS[ keep ] - dateS[ 0 ] ).astype( np.int64 ) if len( dateS ) else np.zeros( 0, dtype=np.int64 )
+    y = np.log( newCaseS[ keep ] )
+    error = y ** -0.5 * ST_DEV_FACTOR
+    rolling = rolling_slopes_( x, y, error, argument.window, argument.stride )
+    return DataFrame( { 'code': code, 'country': country,
+                        'slope': rolling[ "slope" ], 'error': rolling[ "error" ],
+                        'number_of_points': rolling[ "number_of_points" ],
+                        'start_date': ( dateS[ 0 ] + rolling[ "start" ] ).astype( str ) if len( dateS ) else [],
+                        'end_date': ( dateS[ 0 ] + rolling[ "end" ] ).astype( str ) if len( dateS ) else [] },
+                      columns=[ 'code', 'country', 'slope', 'error', 'number_of_points', 'start_date', 'end_date' ] )
         
-# Writes code2country.    
-def code2country_( code2data ): 
+# Returns the score profile of the candidate ends of the initial phase for one country as a DataFrame:
+#   the regression of the points up to each day x and its "score" under argument.criterion (lowest is chosen).
+def score_profile_( argument, code, name2data ): 
+    pointS = name2data[ "pointS" ]
+    profile = breakpoint_profile_( pointS[ "x" ], pointS[ "y" ], pointS[ "error" ], argument.criterion, alpha=argument.alpha )
+    dateS = np.datetime64( name2data[ "startDashDate" ] ) + pointS[ "x" ]
+    return DataFrame( { 'code': code, 'x': pointS[ "x" ], 'end_date': dateS.astype( str ), 'number_of_points': np.arange( 1, len( pointS ) + 1 ),
+                        'slope': profile[ "beta1" ], 'error': profile[ "beta1_error" ], 'chi2': profile[ "chi2" ], 'score': profile[ "score" ],
+                        'chosen': np.arange( len( pointS ) ) == profile[ "k" ] } )
+
+# Returns the key of the regression cache for the points and the parameters that produced them.
+def cache_key_( argument, pointS ): 
+    parameterS = [ argument.threshold, argument.datum_for_threshold, argument.new_cases, argument.st_dev_factor, argument.engine ]
+    if argument.criterion != 'arrp':
+        parameterS += [ argument.criterion, argument.alpha ]
+    return sha256( dumps( parameterS ).encode() + pointS.tobytes() ).hexdigest()
+
+# Returns the extracted points and the arrp regression (None if it fails) for one country.
+#   The regression is reused from cache if the points and parameters are unchanged.
+def fit_( argument, code, country, dataS, cache=None ): 
+    oFBC = f'{argument.odir}{argument.cdir}{code}' if argument.odir is not None else None # basename of output files for code
+    # With a store, the python engine writes no *.dat and *.out files; arrp.exe still needs them.
+    textFBC = oFBC if argument.store is None or argument.engine != 'python' else None
+    name2data = name2data_( argument, dataS )
+    rolling = None
+    if argument.window > 0:
+        rolling = rolling_( argument, code, country, dataS )
+        if oFBC is not None:
+            rolling.to_csv( f'{oFBC}_rolling.csv', index = False )
+    pointS = name2data[ "pointS" ]
+    arrpout = None
+    messageS = []
+    profile = None
+    if argument.score_profile and len( pointS ) >= 2:
+        profile = score_profile_( argument, code, name2data )
+        if oFBC is not None:
+            profile.to_csv( f'{oFBC}_score.csv', index = False )
+    key = cache_key_( argument, pointS )
+    if cache is not None and oFBC is not None and cache[ "key" ] == key and ( textFBC is None or isfile( f'{oFBC}.out' ) ):
+        messageS.append( f'-- unchanged, cached regression reused --' )
+        return { "name2data": name2data, "arrpout": cache[ "arrpout" ], "messageS": messageS, "cache": cache, "rolling": rolling, "profile": profile }
+    # Removes the files of an earlier run, so a failed regression never reads a stale *.out file.
+    for ofn in ( [ f'{oFBC}.dat', f'{oFBC}.out' ] if oFBC is not None else [] ):
+        if isfile( ofn ):
+            remove( ofn )
+    if len( pointS ) < 2:
+        messageS.append( f'-- arrp needs at least 2 points to regress --' )
+    else:   
+        if textFBC is not None:
+            with open( f'{oFBC}.dat', 'w' ) as oFH:
+                for point in pointS:
+                    oFH.write( "%d\t%f\t%f\n" % ( point["x"], point["y"], point["error"] ) )
+        if argument.engine == 'python':
+            # Regresses in memory; the *.out file is written only as a record.
+            ( x, y, error ) = ( pointS[ "x" ], pointS[ "y" ], pointS[ "error" ] )
+            arrpout = arrp_( x, y, error, criterion=argument.criterion, alpha=argument.alpha )
+            if textFBC is not None:
+                write_arrp_out_( f'{oFBC}.out', f'{oFBC}.dat', x, y, error, arrpout )
+        else:
+            try:
+                system( f'arrp.exe -in {oFBC}.dat -out {oFBC}.out -include left 1> /dev/null 2> /dev/null' )
+            except:
+                messageS.append( f'-- "{country}" arrp threw an error --' )
+            if isfile( f'{oFBC}.out' ):
+                arrpout = read_arrp_out_( f'{oFBC}.out' )
+    if arrpout is None:
+        return { "name2data": name2data, "arrpout": None, "messageS": messageS, "cache": None, "rolling": rolling, "profile": profile }
+    arrpout = dict( arrpout, range=list( arrpout[ "range" ] ), weightS=[ int( weight ) for weight in arrpout[ "weightS" ] ] )
+    return { "name2data": name2data, "arrpout": arrpout, "messageS": messageS, "cache": { "key": key, "arrpout": arrpout }, "rolling": rolling, "profile": profile }
+
+# Returns fit_( ... ) with the wall-clock "start", the "seconds" taken, and the "pid" and "peak_rss" of the process that ran it.
+#   With argument.bootstrap or argument.jackknife, "resample" holds the resampling columns of the initial-phase slope.
+def timed_fit_( argument, code, country, dataS, cache=None ): 
+    start = time()
+    fit = fit_( argument, code, country, dataS, cache )
+    if fit[ "arrpout" ] is not None and ( argument.bootstrap > 0 or argument.jackknife ):
+        pointS = fit[ "name2data" ][ "pointS" ][ :number_of_points_( fit[ "arrpout" ] ) ]
+        # Seeds each country by its code, so the replicates depend neither on the order of the countries nor on --jobs.
+        seed = np.random.SeedSequence( [ argument.seed ] + list( code.encode() ) )
+        fit[ "resample" ] = resample_( pointS[ "x" ], pointS[ "y" ], pointS[ "error" ], argument.bootstrap,
+                                       loads( argument.quantiles ), argument.jackknife, seed, argument.block )
+    return dict( fit, start=start, seconds=time() - start, pid=getpid(), peak_rss=peak_rss() )
+
+# Returns code2country and code2fit from the stream countryS, fitting in a process pool if argument.jobs > 1.
+def code2country_( countryS, argument, code2cache ): 
     code2country = dict()
-    for code in code2data.keys():
-        code2country[ code ] = code2data[ code ][ "location" ]
-    return code2country
+    code2fit = dict()
+    if argument.jobs <= 1:
+        for ( code, country, dataS ) in countryS:
+            code2country[ code ] = country
+            code2fit[ code ] = timed_fit_( argument, code, country, dataS, code2cache.get( code ) )
+        return code2country, code2fit
+    future2code = dict()
+    with ProcessPoolExecutor( max_workers=argument.jobs ) as executor:
+        for ( code, country, dataS ) in countryS:
+            code2country[ code ] = country
+            # Bounds the countries in flight, so memory stays bounded by a few countries per worker.
+            if len( future2code ) >= 2 * argument.jobs:
+                doneS, _ = wait( future2code, return_when=FIRST_COMPLETED )
+                for future in doneS:
+                    code2fit[ future2code.pop( future ) ] = future.result()
+            future2code[ executor.submit( timed_fit_, argument, code, country, dataS, code2cache.get( code ) ) ] = code
+        for future in as_completed( future2code ):
+            code2fit[ future2code[ future ] ] = future.result()
+    return code2country, code2fit
         
-# Check and fixes arguments if possible.    
+# Check and fixes arguments if possible; prints the error and exits with status 1 if not.    
 def check( argument ): 
-    if not exists( argument.idir ):
-        print( f'Error: a valid INPUT_DIRECTORY "{argument.idir}" is required.' )
-        exit()
+    try:
+        check_( argument )
+    except ( FileNotFoundError, ValueError ) as error:
+        print( f'Error: {error}' )
+        exit(1)
+
+# Check and fixes arguments if possible; raises FileNotFoundError for a missing input and ValueError for invalid options, so run() can be embedded.
+def check_( argument ): 
+    if argument.long_fn:
+        if not isfile( argument.long_fn ):
+            raise FileNotFoundError( f'a valid LONG_FN "{argument.long_fn}" is required.' )
+    elif not exists( argument.idir ):
+        raise FileNotFoundError( f'a valid INPUT_DIRECTORY "{argument.idir}" is required.' )
     if not argument.idir.endswith( '/' ):
         argument.idir = f'{argument.idir}/'
-    if not isfile( f'{argument.idir}{argument.json_file}' ):
-        print( f'Error: a valid INPUT_JSON_FILE "{argument.idir}{argument.json_file}" is required.' )
-        exit()
+    if not argument.long_fn and not isfile( f'{argument.idir}{argument.json_file}' ):
+        raise FileNotFoundError( f'a valid INPUT_JSON_FILE "{argument.idir}{argument.json_file}" is required.' )
     
+    if argument.export and argument.store is None:
+        raise ValueError( f'a STORE is required by --export.' )
+    if argument.criterion != 'arrp' and argument.engine != 'python':
+        raise ValueError( f'CRITERION "{argument.criterion}" needs ENGINE "python".' )
+    if argument.cache_dir is not None and not argument.cache_dir.endswith( '/' ):
+        argument.cache_dir = f'{argument.cache_dir}/'
+
+    if argument.odir is None: # in-memory run()
+        return
     if not argument.odir.endswith( '/' ):
         argument.odir = f'{argument.odir}/'
+    if argument.export and not isfile( f'{argument.odir}{argument.store}' ):
+        raise FileNotFoundError( f'a valid STORE "{argument.odir}{argument.store}" is required by --export.' )
     if not exists( argument.odir ):
         mkdir( f'{argument.odir}' )
     if not argument.cdir.endswith( '/' ):
@@ -183,6 +513,49 @@ def getArguments():
                         help="NEW_CASES", metavar="NEW_CASES")
     parser.add_argument("-s", "--st_dev_factor", dest="st_dev_factor", type=float, default=1.0, # Multiplies the calculated standdard deviation for Y-error.
                         help="ST_DEV_FACTOR", metavar="ST_DEV_FACTOR")
+    parser.add_argument("-e", "--engine", dest="engine", default="exe", choices=["python", "exe"], # "python" regresses in memory without arrp.exe.
+                        help="ENGINE", metavar="ENGINE")
+    parser.add_argument("--jobs", dest="jobs", type=int, default=1, # number of worker processes for extraction and regression
+                        help="JOBS", metavar="JOBS")
+    parser.add_argument("--no_cache", dest="no_cache", action="store_true", # refits every country, ignoring the regression cache
+                        help="NO_CACHE")
+    parser.add_argument("-w", "--window", dest="window", type=int, default=0, # days per rolling-window regression over the whole series; 0 skips slope_rolling.csv
+                        help="WINDOW", metavar="WINDOW")
+    parser.add_argument("--stride", dest="stride", type=int, default=1, # days between the ends of consecutive rolling windows
+                        help="STRIDE", metavar="STRIDE")
+    parser.add_argument("--criterion", dest="criterion", default="arrp", choices=CRITERIA, # selects the end of the initial phase; "arrp" as arrp.exe, others need -e python
+                        help="CRITERION", metavar="CRITERION")
+    parser.add_argument("--alpha", dest="alpha", type=float, default=0.05, # significance of the chi-square goodness of fit for CRITERION "pvalue"
+                        help="ALPHA", metavar="ALPHA")
+    parser.add_argument("--score_profile", dest="score_profile", action="store_true", # writes the score of every candidate end day to Countries/[code]_score.csv
+                        help="SCORE_PROFILE")
+    parser.add_argument("--bootstrap", dest="bootstrap", type=int, default=0, # block-bootstrap replicates of the initial-phase slope; adds columns slope_q[quantile] to slope.csv
+                        help="BOOTSTRAP", metavar="BOOTSTRAP")
+    parser.add_argument("--block", dest="block", type=int, default=7, # consecutive points per bootstrap block
+                        help="BLOCK", metavar="BLOCK")
+    parser.add_argument("--quantiles", dest="quantiles", default="[0.025,0.975]", # JSON list of bootstrap quantiles of the slope
+                        help="QUANTILES", metavar="QUANTILES")
+    parser.add_argument("--jackknife", dest="jackknife", action="store_true", # adds the leave-one-out standard error jackknife_error to slope.csv
+                        help="JACKKNIFE")
+    parser.add_argument("--seed", dest="seed", type=int, default=0, # seed of the bootstrap replicates
+                        help="SEED", metavar="SEED")
+    parser.add_argument("-l", "--long_fn", dest="long_fn", default=None, # long-format *.csv or *.parquet with one row per series and day, read instead of INPUT_JSON_FILE
+                        help="LONG_FN", metavar="LONG_FN")
+    parser.add_argument("--key_column", dest="key_column", default="code", # LONG_FN column naming each series, e.g., "fips"; a series' rows must be contiguous
+                        help="KEY_COLUMN", metavar="KEY_COLUMN")
+    parser.add_argument("--location_column", dest="location_column", default=None, # LONG_FN column with the name of each series written as country
+                        help="LOCATION_COLUMN", metavar="LOCATION_COLUMN")
+    parser.add_argument("--date_column", dest="date_column", default="date", # LONG_FN column with the dates
+                        help="DATE_COLUMN", metavar="DATE_COLUMN")
+    parser.add_argument("--store", dest="store", default=None, # SQLite file in OUTPUT_DIRECTORY holding each run's points and regressions; the python engine then writes no *.dat, *.out files
+                        help="STORE", metavar="STORE")
+    parser.add_argument("--export", dest="export", action="store_true", # writes *.dat, *.out files in COUNTRY_DIRECTORY from the latest run in STORE and exits
+                        help="EXPORT")
+    parser.add_argument("--cache_dir", dest="cache_dir", default=None, # directory of the columnar cache of INPUT_JSON_FILE, built on first use and rebuilt when the file changes
+                        help="CACHE_DIRECTORY", metavar="CACHE_DIRECTORY")
+    parser.add_argument("--sweep", dest="sweep", default=None, # JSON object from threshold, datum_for_threshold, new_cases, st_dev_factor to lists of values; writes slope_sweep.csv with the python engine
+                        help="SWEEP", metavar="SWEEP")
+    add_arguments( parser )
     return parser
     
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Streams a long-format case file (one row per series and day) one series at a time.
+
+The file is *.csv, or *.parquet if pyarrow is installed, with a key column naming the series (e.g., a county FIPS code),
+  a date column and the data columns.
+It is read CHUNK_SIZE rows at a time, and each series is yielded as the columns of owid_columns_(),
+  so memory is bounded by a chunk and the largest single series.
+The rows of a series must be contiguous, e.g., sorted by key; the days of a series may come in any order.
+"""
+
+# Import libraries
+import numpy as np
+import pandas as pd
+try:
+    import pyarrow.parquet as pq
+except ImportError: # Parquet input is optional
+    pq = None
+
+CHUNK_SIZE = 1 << 16 # rows read per chunk
+
+# Yields ( code, location, column2array ) for each series in the long-format file ifn:
+#   code from the column key, location from the column location (or the code), and column2array holding
+#   "date" (datetime64[D], increasing) and each column in nameS (float64; missing columns are left out).
+def long_series_( ifn, key, date, nameS, location=None, chunk_size=CHUNK_SIZE ):
+    colS = list( dict.fromkeys( [ key, date ] + ( [ location ] if location else [] ) + list( nameS ) ) )
+    doneS = set() # keys already yielded, to detect series split across the file
+    pending = None # rows of the last series of a chunk, which may continue in the next chunk
+    for frame in long_chunks_( ifn, colS, key, location, chunk_size ):
+        if pending is not None:
+            frame = pd.concat( [ pending, frame ], ignore_index=True )
+        keyS = frame[ key ].to_numpy()
+        startS = np.concatenate( ( [ 0 ], np.flatnonzero( keyS[ 1: ] != keyS[ :-1 ] ) + 1 ) )
+        for ( start, stop ) in zip( startS[ :-1 ], startS[ 1: ] ):
+            yield series_( frame.iloc[ start:stop ], key, date, nameS, location, doneS )
+        pending = frame.iloc[ startS[ -1 ]: ]
+    if pending is not None and len( pending ):
+        yield series_( pending, key, date, nameS, location, doneS )
+
+# Returns ( code, location, column2array ) for the rows frame of one series.
+def series_( frame, key, date, nameS, location, doneS ):
+    code = str( frame[ key ].iloc[ 0 ] )
+    if code in doneS:
+        raise ValueError( f'The rows of series "{code}" are not contiguous; sort the file by "{key}".' )
+    doneS.add( code )
+    frame = frame.sort_values( date, kind='stable' )
+    column2array = { "date": pd.to_datetime( frame[ date ] ).to_numpy().astype( 'datetime64[D]' ) }
+    for name in nameS:
+        if name in frame.columns:
+            column2array[ name ] = frame[ name ].to_numpy( dtype=float, na_value=np.nan )
+    return code, str( frame[ location ].iloc[ 0 ] ) if location else code, column2array
+
+# Yields the rows of ifn with the columns colS (those present) as DataFrames of chunk_size rows.
+def long_chunks_( ifn, colS, key, location, chunk_size ):
+    if ifn.endswith( '.parquet' ):
+        if pq is None:
+            raise ImportError( f'Reading "{ifn}" needs pyarrow.' )
+        parquet = pq.ParquetFile( ifn )
+        presentS = [ col for col in colS if col in parquet.schema_arrow.names ]
+        for batch in parquet.iter_batches( batch_size=chunk_size, columns=presentS ):
+            yield batch.to_pandas().astype( { key: str } )
+        return
+    header = pd.read_csv( ifn, nrows=0 ).columns
+    presentS = [ col for col in colS if col in header ]
+    textS = { col: str for col in ( key, location ) if col }
+    # Parses floats exactly, as the json reader does, so the same data regress the same from either file.
+    yield from pd.read_csv( ifn, usecols=presentS, dtype=textS, chunksize=chunk_size, float_precision='round_trip' )
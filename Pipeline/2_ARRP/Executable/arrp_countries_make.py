@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
-from os import system
+from sys import exit
+from os import system, waitstatus_to_exitcode
 
 from math import sqrt
 
@@ -13,4 +14,4 @@ S = f' -s {factor}'
 T = ' -t 30'
 D = ' -d new_cases_smoothed'
 
-system( f'python arrp_countries.py {N} {S} {T} {D} > {log}' )
+exit( waitstatus_to_exitcode( system( f'python arrp_countries.py {N} {S} {T} {D} > {log}' ) ) )
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""
+Streams the OWID COVID-19 json file one country at a time.
+
+The OWID json file is a single object keyed by 3-letter country code.
+Decoding it whole requires memory for every country at once,
+so the reader decodes one country object, yields it, and discards it.
+
+A columnar cache converts the json file once into one *.npy file per numeric field (and "date"),
+  indexed by a *_index.json file holding each country's code, location and row range.
+Later runs memory-map only the columns they use.
+The cache is rebuilt when the json file changes: a changed size or mtime triggers a sha256 check of its content.
+"""
+
+# Import libraries
+from json import JSONDecoder, JSONDecodeError, load, dump
+from hashlib import sha256
+from os import stat, mkdir, remove
+from os.path import basename, exists, isfile
+import numpy as np
+
+CHUNK_SIZE = 1 << 20 # characters read from the json file per refill
+
+# Yields ( code, location, dataS ) for each country in the OWID json file ifn.
+#   Peak memory is bounded by the largest single country.
+def owid_countries_( ifn, chunk_size=CHUNK_SIZE ):
+    decoder = JSONDecoder()
+    with open( ifn ) as iFH:
+        buffer = ''
+        position = 0
+        # Returns the buffer with the next chunk appended, or None at the end of file.
+        def refill( buffer, position, size ):
+            chunk = iFH.read( size )
+            if not chunk:
+                return None
+            return buffer[ position: ] + chunk
+        # Skips whitespace, refilling as needed; returns ( buffer, position ) at the next token.
+        def skip( buffer, position ):
+            while True:
+                while position < len( buffer ) and buffer[ position ].isspace():
+                    position += 1
+                if position < len( buffer ):
+                    return buffer, position
+                refilled = refill( buffer, position, chunk_size )
+                if refilled is None:
+                    raise ValueError( f'Unexpected end of OWID json file "{ifn}".' )
+                buffer, position = refilled, 0
+        # Decodes the next json value, refilling (with growing reads) until it is complete.
+        def decode( buffer, position ):
+            size = chunk_size
+            while True:
+                try:
+                    value, end = decoder.raw_decode( buffer, position )
+                    return value, buffer, end
+                except JSONDecodeError:
+                    refilled = refill( buffer, position, size )
+                    if refilled is None:
+                        raise
+                    buffer, position = refilled, 0
+                    size *= 2 # Avoids quadratic re-decoding of a large country.
+        buffer, position = skip( buffer, position )
+        if buffer[ position ] != '{':
+            raise ValueError( f'OWID json file "{ifn}" is not a json object.' )
+        position += 1
+        while True:
+            buffer, position = skip( buffer, position )
+            if buffer[ position ] == '}':
+                return
+            if buffer[ position ] == ',':
+                buffer, position = skip( buffer, position + 1 )
+            code, buffer, position = decode( buffer, position )
+            buffer, position = skip( buffer, position )
+            if buffer[ position ] != ':':
+                raise ValueError( f'OWID json file "{ifn}" has no value for "{code}".' )
+            buffer, position = skip( buffer, position + 1 )
+            country, buffer, position = decode( buffer, position )
+            # Discards the decoded text so the buffer never holds more than one country.
+            buffer, position = buffer[ position: ], 0
+            yield code, country.get( "location", code ), country.get( "data", [] )
+
+# Returns the daily records dataS as columns: "date" as datetime64[D] and each name in nameS as float64.
+#   Missing or null values become NaN.
+#   dataS may instead be the columns of a country from owid_cache_countries_(), which are used as they are.
+def owid_columns_( dataS, nameS ):
+    if isinstance( dataS, dict ):
+        column2array = { "date": dataS[ "date" ] }
+        for name in nameS:
+            column2array[ name ] = dataS[ name ] if name in dataS else np.full( len( dataS[ "date" ] ), np.nan )
+        return column2array
+    column2array = { "date": np.array( [ datum[ "date" ] for datum in dataS ], dtype='datetime64[D]' ) }
+    for name in nameS:
+        if name not in column2array:
+            column2array[ name ] = np.array( [ datum.get( name ) for datum in dataS ], dtype=float )
+    return column2array
+
+# Yields ( code, location, column2array ) for each country from the columnar cache in cache_dir of the OWID json file ifn,
+#   building the cache first if it is missing or stale.
+#   Only "date" and the columns nameS are memory-mapped; column2array holds read-only views of them.
+def owid_cache_countries_( ifn, cache_dir, nameS ):
+    index = owid_cache_( ifn, cache_dir )
+    fbn = owid_cache_fbn_( ifn, cache_dir )
+    column2array = { name: np.load( f'{fbn}_{name}.npy', mmap_mode='r' ) for name in [ "date" ] + list( nameS ) if name in index[ "columns" ] }
+    for ( code, location, start, stop ) in zip( index[ "codes" ], index[ "locations" ], index[ "offsets" ][ :-1 ], index[ "offsets" ][ 1: ] ):
+        yield code, location, { name: array[ start:stop ] for ( name, array ) in column2array.items() }
+
+# Returns the basename of the cache files in cache_dir for the OWID json file ifn.
+def owid_cache_fbn_( ifn, cache_dir ):
+    stem = basename( ifn ).rsplit( '.', 1 )[ 0 ]
+    return f'{cache_dir}{stem}'
+
+# Returns the index of the columnar cache of the OWID json file ifn, (re)building the cache if ifn has changed.
+def owid_cache_( ifn, cache_dir ):
+    fbn = owid_cache_fbn_( ifn, cache_dir )
+    status = stat( ifn )
+    if isfile( f'{fbn}_index.json' ):
+        with open( f'{fbn}_index.json' ) as iFH:
+            index = load( iFH )
+        if index[ "size" ] == status.st_size and index[ "mtime" ] == status.st_mtime_ns:
+            return index
+        # A touched but unchanged file keeps its cache.
+        if index[ "size" ] == status.st_size and index[ "sha256" ] == sha256_( ifn ):
+            index[ "mtime" ] = status.st_mtime_ns
+            with open( f'{fbn}_index.json', 'w' ) as oFH:
+                dump( index, oFH )
+            return index
+    print( f'-- Caching "{ifn}" in "{cache_dir}" started --', flush=True )
+    return build_owid_cache_( ifn, cache_dir, status )
+
+# Builds the columnar cache of the OWID json file ifn in cache_dir; returns its index.
+#   Fields holding anything but numbers (e.g., "tests_units") are not cached.
+def build_owid_cache_( ifn, cache_dir, status ):
+    if not exists( cache_dir ):
+        mkdir( cache_dir )
+    fbn = owid_cache_fbn_( ifn, cache_dir )
+    # Removes the index first, so an interrupted build is never mistaken for a valid cache.
+    if isfile( f'{fbn}_index.json' ):
+        remove( f'{fbn}_index.json' )
+    codeS = []
+    locationS = []
+    offsetS = [ 0 ]
+    dateS = []
+    name2chunkS = dict() # field to [ ( offset, array ) ] over the countries with the field
+    textS = set() # fields with a value that is not a number
+    for ( code, location, dataS ) in owid_countries_( ifn ):
+        codeS.append( code )
+        locationS.append( location )
+        dateS.append( np.array( [ datum[ "date" ] for datum in dataS ], dtype='datetime64[D]' ) )
+        nameS = set( name for datum in dataS for name in datum ) - textS - { "date" }
+        for name in sorted( nameS ):
+            try:
+                array = np.array( [ datum.get( name ) for datum in dataS ], dtype=float )
+            except ( TypeError, ValueError ):
+                textS.add( name )
+                name2chunkS.pop( name, None )
+                continue
+            name2chunkS.setdefault( name, [] ).append( ( offsetS[ -1 ], array ) )
+        offsetS.append( offsetS[ -1 ] + len( dataS ) )
+    np.save( f'{fbn}_date.npy', np.concatenate( dateS ) if dateS else np.zeros( 0, dtype='datetime64[D]' ) )
+    for ( name, chunkS ) in name2chunkS.items():
+        column = np.full( offsetS[ -1 ], np.nan )
+        for ( offset, array ) in chunkS:
+            column[ offset:offset + len( array ) ] = array
+        np.save( f'{fbn}_{name}.npy', column )
+    # Writes the index last, after every column.
+    index = { "source": ifn, "size": status.st_size, "mtime": status.st_mtime_ns, "sha256": sha256_( ifn ),
+              "columns": [ "date" ] + sorted( name2chunkS ), "codes": codeS, "locations": locationS, "offsets": offsetS }
+    with open( f'{fbn}_index.json', 'w' ) as oFH:
+        dump( index, oFH )
+    return index
+
+# Returns the sha256 hex digest of the file ifn.
+def sha256_( ifn, chunk_size=CHUNK_SIZE ):
+    digest = sha256()
+    with open( ifn, 'rb' ) as iFH:
+        for chunk in iter( lambda: iFH.read( chunk_size ), b'' ):
+            digest.update( chunk )
+    return digest.hexdigest()
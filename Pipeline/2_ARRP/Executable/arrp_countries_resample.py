@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Block-bootstrap and jackknife resampling of the initial-phase slope of a country.
+
+The initial phase is the range of points that arrp regresses (weight 1); the range is kept fixed in every replicate.
+A replicate is a vector of counts, the number of times each point is drawn,
+  so all replicates are solved together: the counts matrix times the per-point sufficient statistics
+  gives every replicate's weighted least-squares sums at once.
+The moving-block bootstrap draws blocks of BLOCK consecutive points, keeping the serial correlation of smoothed data.
+The jackknife leaves out each point in turn, from the totals less that point's statistics.
+"""
+
+# Import libraries
+import numpy as np
+
+BLOCK = 7 # consecutive points per bootstrap block, the smoothing window of new_cases_smoothed
+CHUNK_SIZE = 1 << 12 # bootstrap replicates solved at once, bounding the memory of the counts matrix
+QUANTILES = [ 0.025, 0.975 ]
+
+# Returns the ( points, 5 ) per-point sufficient statistics w, w*t, w*y, w*t*t, w*t*y of a weighted least-squares line,
+#   t being x centred, which limits cancellation in the determinant.
+def sufficient_statistics_( x, y, error ):
+    x = np.asarray( x, dtype=float )
+    w = 1.0 / ( np.asarray( error, dtype=float ) ** 2 )
+    t = x - x.mean()
+    wy = w * np.asarray( y, dtype=float )
+    return np.stack( ( w, w * t, wy, w * t * t, wy * t ), axis=1 )
+
+# Returns the slopes of the lines with summed statistics sumS[ ..., 5 ]; NaN where fewer than 2 distinct points are weighted.
+def slopes_( sumS ):
+    ( s, sx, sy, sxx, sxy ) = np.moveaxis( sumS, -1, 0 )
+    determinant = s * sxx - sx * sx
+    with np.errstate( divide='ignore', invalid='ignore' ):
+        return np.where( determinant > 0.0, ( s * sxy - sx * sy ) / determinant, np.nan )
+
+# Returns the ( replicates, points ) counts of a moving-block bootstrap of points with blocks of block consecutive points.
+def block_bootstrap_counts_( rng, points, replicates, block=BLOCK ):
+    block = max( 1, min( block, points ) )
+    blocks = -( -points // block )
+    startS = rng.integers( 0, points - block + 1, ( replicates, blocks ) )
+    # Concatenates the blocks of each replicate and truncates them to points.
+    indexS = ( startS[ :, :, np.newaxis ] + np.arange( block ) ).reshape( replicates, -1 )[ :, :points ]
+    indexS = indexS + points * np.arange( replicates )[ :, np.newaxis ]
+    return np.bincount( indexS.ravel(), minlength=replicates * points ).reshape( replicates, points ).astype( float )
+
+# Returns the slopes of replicates block-bootstrap replicates of the points ( x, y, error ).
+def bootstrap_slopes_( x, y, error, replicates, rng, block=BLOCK, chunk_size=CHUNK_SIZE ):
+    statisticS = sufficient_statistics_( x, y, error )
+    slopeS = np.empty( replicates )
+    for start in range( 0, replicates, chunk_size ):
+        size = min( chunk_size, replicates - start )
+        slopeS[ start:start + size ] = slopes_( block_bootstrap_counts_( rng, len( statisticS ), size, block ) @ statisticS )
+    return slopeS
+
+# Returns the leave-one-out slopes of the points ( x, y, error ).
+def jackknife_slopes_( x, y, error ):
+    statisticS = sufficient_statistics_( x, y, error )
+    return slopes_( statisticS.sum( axis=0 ) - statisticS )
+
+# Returns the resampling columns for slope.csv from the initial-phase points ( x, y, error ):
+#   "slope_q[quantile]" for the bootstrap quantiles (with replicates > 0) and "jackknife_error" (with jackknife).
+def resample_( x, y, error, replicates, quantileS=QUANTILES, jackknife=False, seed=None, block=BLOCK ):
+    col2value = dict()
+    if replicates > 0:
+        if len( x ) < 3:
+            slopeS = np.full( 1, np.nan )
+        else:
+            slopeS = bootstrap_slopes_( x, y, error, replicates, np.random.default_rng( seed ), block )
+        # Degenerate replicates (e.g., a block repeated throughout) have no slope and are dropped.
+        slopeS = slopeS[ np.isfinite( slopeS ) ]
+        valueS = np.quantile( slopeS, quantileS ) if len( slopeS ) else np.full( len( quantileS ), np.nan )
+        for ( q, value ) in zip( quantileS, valueS ):
+            col2value[ f'slope_q{q:g}' ] = float( value )
+    if jackknife:
+        n = len( x )
+        if n < 3:
+            col2value[ "jackknife_error" ] = np.nan
+        else:
+            slopeS = jackknife_slopes_( x, y, error )
+            col2value[ "jackknife_error" ] = float( np.sqrt( ( n - 1 ) / n * ( ( slopeS - slopeS.mean() ) ** 2 ).sum() ) )
+    return col2value
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Rolling-window growth rates r(t) over a whole OWID series.
+
+Each window of WINDOW consecutive days is fit by weighted least squares, log(new cases) ~ beta0 + beta1*day.
+The sufficient statistics of a window are the prefix sums at its end less those at its start,
+  i.e., each step adds one day and drops one day instead of refitting the window.
+Days with no data or 0,1 new cases have weight 0.
+"""
+
+# Import libraries
+import numpy as np
+
+# Returns the rolling weighted least-squares slopes of ( x, y, error ) over windows of window consecutive x,
+#   ending every stride days; x holds integer days in increasing order.
+#   Windows with fewer than 2 points of positive weight are dropped.
+def rolling_slopes_( x, y, error, window, stride=1 ):
+    x = np.asarray( x, dtype=np.int64 )
+    if len( x ) == 0:
+        return { "start": np.zeros( 0, dtype=np.int64 ), "end": np.zeros( 0, dtype=np.int64 ), "number_of_points": np.zeros( 0, dtype=np.int64 ),
+                 "slope": np.zeros( 0 ), "error": np.zeros( 0 ) }
+    # Scatters the points onto consecutive days, so a window is a fixed number of entries.
+    dayS = np.arange( x[ 0 ], x[ -1 ] + 1 )
+    w = np.zeros( len( dayS ) )
+    wy = np.zeros( len( dayS ) )
+    valid = np.isfinite( y ) & np.isfinite( error ) & ( error > 0.0 )
+    w[ x[ valid ] - x[ 0 ] ] = 1.0 / ( error[ valid ] * error[ valid ] )
+    wy[ x[ valid ] - x[ 0 ] ] = w[ x[ valid ] - x[ 0 ] ] * y[ valid ]
+    # Centres the days, which limits cancellation in the determinant.
+    t = ( dayS - dayS.mean() ).astype( float )
+    # Prefix sums with a leading 0, so the window ( e - window, e ] has sums P[ e ] - P[ e - window ].
+    def prefix( v ):
+        return np.concatenate( ( [ 0.0 ], np.cumsum( v ) ) )
+    ( P, Pn, Px, Py, Pxx, Pxy ) = [ prefix( v ) for v in ( w, w > 0.0, w * t, wy, w * t * t, wy * t ) ]
+    endS = np.arange( window, len( dayS ) + 1, stride )
+    startS = endS - window
+    s = P[ endS ] - P[ startS ]
+    sx = Px[ endS ] - Px[ startS ]
+    sy = Py[ endS ] - Py[ startS ]
+    sxx = Pxx[ endS ] - Pxx[ startS ]
+    sxy = Pxy[ endS ] - Pxy[ startS ]
+    number_of_points = np.rint( Pn[ endS ] - Pn[ startS ] ).astype( np.int64 )
+    keep = number_of_points >= 2
+    ( s, sx, sy, sxx, sxy ) = ( s[ keep ], sx[ keep ], sy[ keep ], sxx[ keep ], sxy[ keep ] )
+    determinant = s * sxx - sx * sx
+    return { "start": dayS[ startS[ keep ] ], "end": dayS[ endS[ keep ] - 1 ], "number_of_points": number_of_points[ keep ],
+             "slope": ( s * sxy - sx * sy ) / determinant, "error": np.sqrt( s / determinant ) }
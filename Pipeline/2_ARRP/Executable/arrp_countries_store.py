@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Stores the per-country regression artifacts of arrp_countries.py in one SQLite file instead of [code].dat and [code].out.
+
+Each invocation is a run (with its parameters and date); each (run, code) row holds the country's start date,
+  the regression (range, beta0, beta1 and their errors) and its points x, y, error and weights as binary arrays.
+Rows are read back by (run, code) through the primary key; export_text_() rewrites the text files of a run.
+"""
+
+# Import libraries
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from json import dumps, loads
+import numpy as np
+from arrp import write_arrp_out_
+
+SCHEMA = [ '''CREATE TABLE IF NOT EXISTS runs ( run INTEGER PRIMARY KEY, date TEXT, parameters TEXT )''',
+           '''CREATE TABLE IF NOT EXISTS fits ( run INTEGER, code TEXT, country TEXT, start_date TEXT,
+                  range_start INTEGER, range_end INTEGER, beta0 REAL, beta0_error REAL, beta1 REAL, beta1_error REAL,
+                  x BLOB, y BLOB, error BLOB, weight BLOB, PRIMARY KEY ( run, code ) )''' ]
+
+# Returns ( connection, run ) for a new run with the dictionary parameters in the store fn, created if absent.
+def open_store_( fn, parameters ):
+    connection = sqlite3.connect( fn )
+    for statement in SCHEMA:
+        connection.execute( statement )
+    cursor = connection.execute( 'INSERT INTO runs ( date, parameters ) VALUES ( ?, ? )',
+                                 ( datetime.now().isoformat( timespec='seconds' ), dumps( parameters, sort_keys=True ) ) )
+    return connection, cursor.lastrowid
+
+# Adds the points pointS (fields x, y, error) and the regression arrpout (None if it failed) of one country to run.
+#   The rows are committed by the caller, e.g., once per run.
+def write_fit_( connection, run, code, country, startDashDate, pointS, arrpout ):
+    parameterS = [ None ] * 6
+    weightS = np.zeros( len( pointS ), dtype=np.int8 )
+    if arrpout is not None:
+        parameterS = [ int( arrpout[ "range" ][ 0 ] ), int( arrpout[ "range" ][ 1 ] ),
+                       arrpout[ "beta0" ], arrpout[ "beta0_error" ], arrpout[ "beta1" ], arrpout[ "beta1_error" ] ]
+        weightS = np.asarray( arrpout[ "weightS" ], dtype=np.int8 )
+    connection.execute( 'INSERT OR REPLACE INTO fits VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? )',
+                        [ run, code, country, startDashDate ] + parameterS +
+                        [ np.ascontiguousarray( pointS[ "x" ], dtype=np.int64 ).tobytes(),
+                          np.ascontiguousarray( pointS[ "y" ], dtype=np.float64 ).tobytes(),
+                          np.ascontiguousarray( pointS[ "error" ], dtype=np.float64 ).tobytes(), weightS.tobytes() ] )
+
+# Returns the runs in the store fn as a list of { "run", "date", "parameters" }, oldest first.
+def read_runs_( fn ):
+    with closing( sqlite3.connect( fn ) ) as connection:
+        return [ { "run": run, "date": date, "parameters": loads( parameters ) }
+                 for ( run, date, parameters ) in connection.execute( 'SELECT run, date, parameters FROM runs ORDER BY run' ) ]
+
+# Returns the codes stored for run (the latest run if None) in the store fn.
+def read_codes_( fn, run=None ):
+    with closing( sqlite3.connect( fn ) ) as connection:
+        run = latest_run_( connection, run )
+        return [ code for ( code, ) in connection.execute( 'SELECT code FROM fits WHERE run = ? ORDER BY code', ( run, ) ) ]
+
+# Returns the artifacts of code in run (the latest run if None) in the store fn, or None if absent:
+#   "country", "startDashDate", arrays "x", "y", "error", and "arrpout" as from arrp_() (None if the regression failed).
+def read_fit_( fn, code, run=None ):
+    with closing( sqlite3.connect( fn ) ) as connection:
+        run = latest_run_( connection, run )
+        row = connection.execute( 'SELECT * FROM fits WHERE run = ? AND code = ?', ( run, code ) ).fetchone()
+    return None if row is None else row_to_fit_( row )
+
+# Returns the artifacts of a row of the table fits, as read_fit_().
+def row_to_fit_( row ):
+    ( _, _, country, startDashDate, range_start, range_end, beta0, beta0_error, beta1, beta1_error, x, y, error, weight ) = row
+    arrpout = None
+    if range_start is not None:
+        arrpout = { "range": ( range_start, range_end ), "beta0": beta0, "beta0_error": beta0_error,
+                    "beta1": beta1, "beta1_error": beta1_error, "weightS": np.frombuffer( weight, dtype=np.int8 ).astype( int ) }
+    return { "country": country, "startDashDate": startDashDate, "arrpout": arrpout,
+             "x": np.frombuffer( x, dtype=np.int64 ), "y": np.frombuffer( y, dtype=np.float64 ), "error": np.frombuffer( error, dtype=np.float64 ) }
+
+# Writes [code].dat and [code].out in the directory odir for every country of run (the latest run if None) in the store fn.
+#   The *.out files follow arrp.py's layout for either engine.
+def export_text_( fn, odir, run=None ):
+    codeS = []
+    with closing( sqlite3.connect( fn ) ) as connection:
+        run = latest_run_( connection, run )
+        rowS = connection.execute( 'SELECT * FROM fits WHERE run = ? ORDER BY code', ( run, ) )
+        for row in rowS:
+            code = row[ 1 ]
+            codeS.append( code )
+            export_fit_( odir, code, row_to_fit_( row ) )
+    return codeS
+
+# Writes [code].dat and [code].out in the directory odir for the artifacts fit of read_fit_().
+def export_fit_( odir, code, fit ):
+    with open( f'{odir}{code}.dat', 'w' ) as oFH:
+        for ( x, y, error ) in zip( fit[ "x" ], fit[ "y" ], fit[ "error" ] ):
+            oFH.write( "%d\t%f\t%f\n" % ( x, y, error ) )
+    if fit[ "arrpout" ] is not None:
+        write_arrp_out_( f'{odir}{code}.out', f'{odir}{code}.dat', fit[ "x" ], fit[ "y" ], fit[ "error" ], fit[ "arrpout" ] )
+
+# Returns run, or the latest run in the store if run is None.
+def latest_run_( connection, run ):
+    if run is not None:
+        return run
+    return connection.execute( 'SELECT MAX( run ) FROM runs' ).fetchone()[ 0 ]
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Sweeps the regression parameters of arrp_countries.py over a grid of configurations.
+
+The OWID json file is read once into the few columns the grid needs.
+The columns are shared read-only by the worker processes (inherited by fork where available),
+  so each task sends only a country code and returns the rows of every configuration for that country.
+"""
+
+# Import libraries
+from json import loads
+from itertools import product
+from functools import partial
+from multiprocessing import get_context, get_all_start_methods
+from concurrent.futures import ProcessPoolExecutor
+from arrp_countries_owid import owid_columns_
+
+SWEEP_NAMES = { "threshold": int, "datum_for_threshold": str, "new_cases": str, "st_dev_factor": float } # parameters (by dest) a sweep may vary
+
+shared = dict() # read-only data of the worker processes, set before they start
+
+# Returns the configurations of a sweep spec, a JSON object from parameter (by dest) to a list of values,
+#   as a list of dicts over the Cartesian product; a parameter not in spec keeps its value in argument.
+def sweep_configurations( spec, argument ):
+    name2valueS = loads( spec )
+    for name in name2valueS:
+        if name not in SWEEP_NAMES:
+            raise ValueError( f'Unknown sweep parameter "{name}"; use one of {list( SWEEP_NAMES )}.' )
+    nameS = list( SWEEP_NAMES )
+    valueSS = []
+    for name in nameS:
+        valueS = name2valueS.get( name, [ getattr( argument, name ) ] )
+        valueSS.append( [ SWEEP_NAMES[ name ]( value ) for value in ( valueS if isinstance( valueS, list ) else [ valueS ] ) ] )
+    return [ dict( zip( nameS, values ) ) for values in product( *valueSS ) ]
+
+# Returns code2country and code2columns, the columns nameS (and "date") of every country in the stream countryS.
+def owid_columns_once_( countryS, nameS ):
+    code2country = dict()
+    code2columns = dict()
+    for ( code, country, dataS ) in countryS:
+        code2country[ code ] = country
+        code2columns[ code ] = owid_columns_( dataS, nameS )
+    return code2country, code2columns
+
+# Sets the read-only data of a worker process.
+def share_( key2value ):
+    shared.clear()
+    shared.update( key2value )
+
+# Returns function( key, shared[ key ] ) in a worker process.
+def call_shared_( function, key ):
+    return function( key, shared[ key ] )
+
+# Returns [ function( key, key2value[ key ] ) for key in keyS ], computed in jobs worker processes sharing key2value read-only.
+#   function must be picklable, i.e., defined at the top level of a module.
+def map_shared_( function, keyS, key2value, jobs=1 ):
+    share_( key2value )
+    if jobs <= 1 or len( keyS ) <= 1:
+        return [ function( key, key2value[ key ] ) for key in keyS ]
+    # Forked workers inherit shared from this process; other start methods copy it once per worker.
+    if 'fork' in get_all_start_methods():
+        executor = ProcessPoolExecutor( max_workers=jobs, mp_context=get_context( 'fork' ) )
+    else:
+        executor = ProcessPoolExecutor( max_workers=jobs, initializer=share_, initargs=( key2value, ) )
+    with executor:
+        return list( executor.map( partial( call_shared_, function ), keyS, chunksize=max( 1, len( keyS ) // ( 4 * jobs ) ) ) )
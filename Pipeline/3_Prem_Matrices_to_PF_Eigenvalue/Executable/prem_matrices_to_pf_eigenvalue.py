@@ -12,23 +12,105 @@ import pandas as pd
 
 import numpy as np
 from scipy.linalg import eig
-from json import loads, dumps
+from json import load, loads, dumps
+
+from prem_matrices_to_pf_eigenvalue_sweep import sweep_excludes, pf_eigenvalue_sweep
+import sys
+from os.path import abspath, dirname
+sys.path.insert( 0, dirname( dirname( dirname( abspath( __file__ ) ) ) ) ) # Pipeline/ holds instrument.py
+from instrument import add_arguments, instrumented, span
 
 def main(): 
     parser = getArguments()
     argument = parser.parse_args()
     check( argument )  
 
+    with instrumented( 'prem_matrices_to_pf_eigenvalue', argument.trace, argument.profile ):
+        code2country = code2country_( argument.code_fn )
+        with span( 'load_matrices', store=bool( argument.matrix_store ) ):
+            if argument.matrix_store:
+                ( codeS, countryS, matrix0S ) = load_matrix_store( argument.matrix_store, code2country )
+            else:
+                ( codeS, countryS, matrix0S ) = load_matrix_csvs( argument.pdir, code2country )
+        pf_eigenvalue_( argument, codeS, countryS, matrix0S )
+
+# Returns { "pf_eigenvalue": DataFrame as pf_eigenvalue.csv, "sweep": DataFrame as pf_eigenvalue_sweep.csv or None }.
+#   The Prem matrices are matrix0S (indexed by codeS) if given, else read as the command line does.
+#   Keywords override the defaults of the command-line arguments (by dest); files are written only if odir is given.
+def run( codeS=None, countryS=None, matrix0S=None, odir=None, **name2value ): 
+    argument = getArguments().parse_args( [] )
+    for ( name, value ) in dict( name2value, odir=odir ).items():
+        if not hasattr( argument, name ):
+            raise TypeError( f'run() got an unexpected argument "{name}".' )
+        setattr( argument, name, value )
+    if not isinstance( argument.excludes, str ):
+        argument.excludes = dumps( argument.excludes )
+    if matrix0S is None:
+        check_( argument )
+        code2country = code2country_( argument.code_fn )
+        if argument.matrix_store:
+            ( codeS, countryS, matrix0S ) = load_matrix_store( argument.matrix_store, code2country )
+        else:
+            ( codeS, countryS, matrix0S ) = load_matrix_csvs( argument.pdir, code2country )
+    elif countryS is None:
+        code2country = code2country_( argument.code_fn )
+        countryS = [ code2country.get( code, code ) for code in codeS ]
+    if odir is not None and not exists( f'{odir}' ):
+        mkdir( f'{odir}' )
+    return pf_eigenvalue_( argument, list( codeS ), list( countryS ), np.asarray( matrix0S ) )
+
+# Returns the dictionary from code to country in the UN code file code_fn.
+def code2country_( code_fn ): 
     # Loads UN ISO 3166-1 alpha-3 Country Codes from columns in *.csv file.
     # The UN made errors in columns, so the read needs to specify relevant columns (which are uncorrupted).
     fields = ['Country or Area', 'ISO-alpha3 Code']
-    df = pd.read_csv( f'{argument.code_fn}', skipinitialspace=True, usecols=fields )
-    code2country = df.set_index('ISO-alpha3 Code').to_dict()['Country or Area']
-        
-    # Processes all the *.csv files in f'{argument.pdir}'.
-    values = []
+    df = pd.read_csv( f'{code_fn}', skipinitialspace=True, usecols=fields )
+    return df.set_index('ISO-alpha3 Code').to_dict()['Country or Area']
+
+# Calculates the Perron-Frobenius eigenvalues of the Prem matrices matrix0S (and their excludes);
+#   writes pf_eigenvalue.csv (and pf_eigenvalue_sweep.csv) if argument.odir is not None.
+def pf_eigenvalue_( argument, codeS, countryS, matrix0S ): 
+    with span( 'validate', items=len( matrix0S ) ):
+        validation = assertPremMatrix( matrix0S ) # the only scan of the matrices
+    for code in np.array( codeS, dtype=object )[ ~validation[ "irreducible" ] ]:
+        print( f'-- Prem matrix "{code}" is reducible --', flush=True )
+    cols = ['ISO-alpha3 Code', 'country', 'pf_eigenvalue']
+    excludes = loads( argument.excludes )
+    with span( 'perron_frobenius_eigvals', items=len( matrix0S ) * ( 1 + len( excludes ) ) ):
+        col2values = { 'ISO-alpha3 Code': codeS, 'country': countryS, 'pf_eigenvalue': perron_frobenius_eigvals( matrix0S, validation ) }
+        for exclude in excludes: # row&col numbers to delete
+            col = 'pf_eigenvalue ' + dumps( exclude )
+            cols.append( col )
+            matrixS = np.delete( np.delete( matrix0S, exclude, 1 ), exclude, 2 )
+            col2values[ col ] = perron_frobenius_eigvals( matrixS, submatrix_validation( validation, matrixS ) )
+    df = pd.DataFrame( col2values, columns = cols ) 
+    #df.set_index('ISO-alpha3 Code')
+    #df['ISO-alpha3 Code']=df.index
+    if argument.odir is not None:
+        ofn = f'{argument.odir}pf_eigenvalue.csv'
+        if isfile( ofn ):
+            remove( ofn )
+        df.to_csv( ofn, index=False )
+    df_sweep = None
+    if argument.sweep:
+        excludeS = sweep_excludes( argument.sweep, matrix0S.shape[1] )
+        print( f'-- Sweeping {len( excludeS )} excludes started --', flush=True )
+        with span( 'pf_eigenvalue_sweep', items=len( matrix0S ) * len( excludeS ) ):
+            df_sweep = pf_eigenvalue_sweep( codeS, countryS, matrix0S, excludeS )
+        if argument.odir is not None:
+            ofn = f'{argument.odir}pf_eigenvalue_sweep.csv'
+            if isfile( ofn ):
+                remove( ofn )
+            df_sweep.to_csv( ofn, index=False )
+    return { "pf_eigenvalue": df, "sweep": df_sweep }
+
+# Returns codeS, countryS and the stack of Prem matrices from all the [code].csv files in pdir.
+def load_matrix_csvs( pdir, code2country ): 
+    codeS = []
+    countryS = []
+    matrixS = []
     count = 0
-    for ifn in sorted( listdir( f'{argument.pdir}' ) ):
+    for ifn in sorted( listdir( f'{pdir}' ) ):
         code = iso_csv_to_code( ifn )
         if code is None:
             print( "Invalid input *.csv name:", ifn )
@@ -39,45 +121,55 @@ def main():
             country = code
         count += 1
         print( f'-- Reading "{ifn}" started --', flush=True )
-        dataframe = pd.read_csv( f'{argument.pdir}{ifn}' )
+        dataframe = pd.read_csv( f'{pdir}{ifn}' )
         first_column = dataframe.columns[0]
         # Delete first
         dataframe = dataframe.drop([first_column], axis=1)
-        # Calculates for the full Prem matrix.
-        vector = [ code, country ]
         matrix0 = dataframe.to_numpy()
-        assertPremMatrix( matrix0 )
-        # Iterates through exclude.
-        matrix = matrix0.copy()
-        excludes = loads( argument.excludes )
-        while True:
-            eigval, eigvec = perron_frobenius_eig( matrix )
-            vector.append( eigval )
-            if not excludes:
-                break
-            exclude = excludes.pop(0) # row&col numbers to delete
-            matrix = np.delete( np.delete( matrix0, exclude, 0 ), exclude, 1 )
-            assert is_square( matrix )
-            assert is_nonnegative( matrix )
-        values.append( vector )
+        codeS.append( code )
+        countryS.append( country )
+        matrixS.append( matrix0 )
     print( f'-- Processed {count} Prem matrices --', flush=True )
-    cols = ['ISO-alpha3 Code', 'country', 'pf_eigenvalue']
-    excludes = loads( argument.excludes )
-    for exclude in excludes:
-        cols.append( 'pf_eigenvalue ' + dumps( exclude ) )
-    df = pd.DataFrame( values, columns = cols ) 
-    #df.set_index('ISO-alpha3 Code')
-    #df['ISO-alpha3 Code']=df.index
-    ofn = f'{argument.odir}pf_eigenvalue.csv'
-    if isfile( ofn ):
-        remove( ofn )
-    df.to_csv( ofn, index=False )
+    matrix0S = np.stack( matrixS ) if matrixS else np.zeros( ( 0, 16, 16 ) )
+    return codeS, countryS, matrix0S
+
+# Returns codeS, countryS and the stack of Prem matrices from the binary store [fbn].npy and [fbn].json.
+#   The tensor is memory-mapped read-only, so no copy is made when the store holds only valid codes.
+def load_matrix_store( fbn, code2country ): 
+    with open( f'{fbn}.json' ) as iFH:
+        index = load( iFH )
+    print( f'-- Reading "{fbn}.npy" started --', flush=True )
+    matrix0S = np.load( f'{fbn}.npy', mmap_mode='r' )
+    keepS = []
+    codeS = []
+    countryS = []
+    for ( i, code ) in enumerate( index[ "codes" ] ):
+        if iso_csv_to_code( f'{code}.csv' ) is None:
+            print( "Invalid store code:", code )
+            continue
+        country = code2country.get(code)
+        if country is None:
+            print( "Invalid 3-letter store code:", code )
+            country = code
+        keepS.append( i )
+        codeS.append( code )
+        countryS.append( country )
+    # Sorts by code, as for the *.csv files.
+    order = sorted( range( len( codeS ) ), key=lambda j: codeS[ j ] )
+    keepS = [ keepS[ j ] for j in order ]
+    if keepS != list( range( len( matrix0S ) ) ):
+        matrix0S = matrix0S[ keepS ]
+    print( f'-- Processed {len( keepS )} Prem matrices --', flush=True )
+    return [ codeS[ j ] for j in order ], [ countryS[ j ] for j in order ], matrix0S
 
-# Halts execution if df is not a Prem matrix.    
+# Halts execution if matrix (or any matrix in a stack) is not a Prem matrix; returns its validation.    
 def assertPremMatrix( matrix ): 
     SIXTEEN = 16
-    assert matrix.shape == (SIXTEEN, SIXTEEN) 
-    assert is_nonnegative( matrix ) 
+    validation = validate( matrix )
+    assert validation[ "shape" ] == (SIXTEEN, SIXTEEN) 
+    assert validation[ "finite" ].all()
+    assert validation[ "nonnegative" ].all()
+    return validation
 
 # Returns upper-case 3-letter code for filename [code].csv or None.    
 def iso_csv_to_code( ifn ): 
@@ -99,16 +191,47 @@ def is_square( np_array ):
 
 # Returns True if all elements are nonnegative.
 def is_nonnegative( np_array ):
-    for x in np.nditer(np_array):
-        if x < 0.0:
-            return False
-    return True
+    return not np.any( np_array < 0.0 )
+
+# Returns True for each matrix in a stack whose directed graph is strongly connected.
+def is_irreducible( np_arrays ):
+    n = np_arrays.shape[-1]
+    # Squares the reachability matrix of (I + A) until paths of length n-1 are covered.
+    reach = ( ( np_arrays > 0.0 ) | np.eye( n, dtype=bool ) ).astype( np.int64 )
+    length = 1
+    while length < n - 1:
+        reach = ( reach @ reach > 0 ).astype( np.int64 )
+        length *= 2
+    return reach.astype( bool ).all( axis=(-2, -1) )
+
+# Returns the validation of a matrix or a stack of matrices from a single scan.
+#   "shape" and "square" describe each matrix; "finite", "nonnegative", "positive" and "irreducible" hold one boolean per matrix.
+def validate( np_arrays ):
+    stack = np_arrays[ np.newaxis ] if np_arrays.ndim == 2 else np_arrays
+    square = stack.ndim == 3 and stack.shape[1] == stack.shape[2]
+    axes = tuple( range( 1, stack.ndim ) )
+    irreducible = is_irreducible( stack ) if square else np.zeros( len( stack ), dtype=bool )
+    return { "shape": stack.shape[1:], "square": square,
+             "finite": np.isfinite( stack ).all( axis=axes ),
+             "nonnegative": ~( stack < 0.0 ).any( axis=axes ),
+             "positive": ( stack > 0.0 ).all( axis=axes ),
+             "irreducible": irreducible }
+
+# Returns the validation of the principal submatrices np_arrays derived by np.delete from matrices with validation, without a scan.
+#   Finiteness, nonnegativity and positivity carry over; irreducibility does not, and no caller needs it, so it is left out.
+def submatrix_validation( validation, np_arrays ):
+    stack = np_arrays[ np.newaxis ] if np_arrays.ndim == 2 else np_arrays
+    return { "shape": stack.shape[1:], "square": stack.shape[1] == stack.shape[2],
+             "finite": validation[ "finite" ], "nonnegative": validation[ "nonnegative" ], "positive": validation[ "positive" ] }
 
 # Calculates Perron-Frobenius eigenvalue and eigenvector.
-def perron_frobenius_eig( np_array ):
-    if not is_square( np_array ):
+#   validation from validate() or submatrix_validation() avoids rescanning np_array.
+def perron_frobenius_eig( np_array, validation=None ):
+    if validation is None:
+        validation = validate( np_array )
+    if np_array.ndim != 2 or not validation[ "square" ]:
         raise ValueError('np_array is not a square two-dimensional matrix.')
-    if not is_nonnegative( np_array ):
+    if not validation[ "nonnegative" ].all():
         raise ValueError('np_array contains negative elements.')
     vals, vecs = eig(np_array)
     maxcol = list(vals).index(max(vals))
@@ -118,13 +241,38 @@ def perron_frobenius_eig( np_array ):
         perron_frobenius_eigvec = -perron_frobenius_eigvec
     return perron_frobenius_eigval.real, perron_frobenius_eigvec.real
 
-# Checks and fixes arguments if possible.    
+# Calculates Perron-Frobenius eigenvalues of a stack of square matrices np_arrays[i,:,:] in one batched call.
+#   validation from validate() or submatrix_validation() avoids rescanning np_arrays.
+def perron_frobenius_eigvals( np_arrays, validation=None ):
+    if validation is None:
+        validation = validate( np_arrays )
+    if np_arrays.ndim != 3 or not validation[ "square" ]:
+        raise ValueError('np_arrays is not a stack of square two-dimensional matrices.')
+    if not validation[ "nonnegative" ].all():
+        raise ValueError('np_arrays contains negative elements.')
+    if len( np_arrays ) == 0:
+        return np.zeros( 0 )
+    # The Perron-Frobenius eigenvalue of a nonnegative matrix is real and has the largest real part.
+    return np.linalg.eigvals( np_arrays ).real.max( axis=-1 )
+
+# Checks and fixes arguments if possible; prints the error and exits with status 1 if not.    
 def check( argument ): 
-    if not exists( f'{argument.odir}' ):
+    try:
+        check_( argument )
+    except FileNotFoundError as error:
+        print( f'Error: {error}' )
+        exit(1)
+
+# Checks and fixes arguments if possible; raises FileNotFoundError for a missing input, so run() can be embedded.
+def check_( argument ): 
+    if argument.odir is not None and not exists( f'{argument.odir}' ):
         mkdir( f'{argument.odir}' )
+    if argument.matrix_store:
+        if not isfile( f'{argument.matrix_store}.npy' ) or not isfile( f'{argument.matrix_store}.json' ):
+            raise FileNotFoundError( f'a valid MATRIX_STORE "{argument.matrix_store}" is required.' )
+        return
     if not exists( f'{argument.pdir}' ):
-        print( f'Error: a valid PREM_MATRICES_DIRECTORY "{argument.pdir}" is required.' )
-        exit
+        raise FileNotFoundError( f'a valid PREM_MATRICES_DIRECTORY "{argument.pdir}" is required.' )
     if not f'{argument.pdir}'.endswith('/'):
         argument.pdir += '/'        
     
@@ -138,6 +286,11 @@ def getArguments():
                         help="PREM_MATRICES_DIRECTORY", metavar="PREM_MATRICES_DIRECTORY")
     parser.add_argument("-e", "--exclude_from_prem_matrices", dest="excludes", default="[]", # rows&cols to delete from Prem matrix eigenvalue calculation.
                         help="EXCLUDE_FROM_PREM_MATRICES", metavar="EXCLUDE_FROM_PREM_MATRICES")
+    parser.add_argument("-m", "--matrix_store", dest="matrix_store", default=None, # basename of the *.npy/*.json Prem matrix store, read instead of PREM_MATRICES_DIRECTORY
+                        help="MATRIX_STORE", metavar="MATRIX_STORE")
+    parser.add_argument("-w", "--sweep", dest="sweep", default=None, # JSON list of excludes or keywords prefixes,bands,all; writes long-format pf_eigenvalue_sweep.csv
+                        help="SWEEP", metavar="SWEEP")
+    add_arguments( parser )
     return parser
     
 if __name__ == "__main__":
@@ -1,11 +1,13 @@
 #!/usr/bin/env python
 
-from os import system
+from sys import exit
+from os import system, waitstatus_to_exitcode
 
 log = f'prem_matrices_to_pf_eigenvalue.log'
 
 C = ' -c ../../1_Prem_Matrices_to_df/Data/UNSDMethodology.csv'
 P = ' -p ../../1_Prem_Matrices_to_df/Output/'
+M = ' -m ../../1_Prem_Matrices_to_df/Output/prem_matrices'
 E = ' -e [[0],[0,1],[0,1,2],[0,1,2,3],[0,1,2,3,4],[0,1,2,3,4,5],[0,1,2,3,4,5,6],[0,1,2,3,4,5,6,7]]'
 
-system( f'python prem_matrices_to_pf_eigenvalue.py {C} {P} {E} > {log}' )
+exit( waitstatus_to_exitcode( system( f'python prem_matrices_to_pf_eigenvalue.py {C} {P} {M} {E} > {log}' ) ) )
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Sweeps Perron-Frobenius eigenvalues of Prem matrices over many sets of excluded strata.
+
+Each exclude (a set of row&col numbers to delete) is solved for every country at once by np.linalg.eigvals,
+  the excludes keeping as many strata being stacked into the same call.
+Results are cached by (frozenset of excluded strata, country code), as eigenvalues only.
+dominant_eig() is a batched power iteration for callers that can warm-start it, e.g., r0_arrp_ngm.py.
+"""
+
+# Import libraries
+from json import loads, dumps
+import numpy as np
+import pandas as pd
+
+TOLERANCE = 1.0e-13 # maximum estimated error in the normalized eigenvector at convergence
+FLOOR = 1.0e-6 # smallest starting coordinate, relative to the mean coordinate
+MAX_ITERATION = 1000 # power iterations before falling back to a full eigen solve
+BATCH = 1 << 21 # matrix entries stacked into one eigen solve of the sweep
+
+# Returns the excludes for a sweep spec: a JSON list of row&col number lists,
+#   or comma-separated keywords "prefixes" (strata 0..i), "bands" (every contiguous age band), "all" (every proper subset).
+def sweep_excludes( spec, n=16 ):
+    spec = spec.strip()
+    if spec.startswith( '[' ):
+        return [ sorted( set( exclude ) ) for exclude in loads( spec ) ]
+    excludeS = []
+    for keyword in spec.split( ',' ):
+        keyword = keyword.strip()
+        if keyword == 'prefixes':
+            excludeS.extend( list( range( i + 1 ) ) for i in range( n - 1 ) )
+        elif keyword == 'bands':
+            excludeS.extend( list( range( i, j ) ) for i in range( n ) for j in range( i + 1, n + 1 ) if j - i < n )
+        elif keyword == 'all':
+            excludeS.extend( [ i for i in range( n ) if mask >> i & 1 ] for mask in range( 1, ( 1 << n ) - 1 ) )
+        else:
+            raise ValueError( f'Unknown sweep keyword "{keyword}".' )
+    # Removes duplicates, keeping the first occurrence.
+    return [ list( exclude ) for exclude in dict.fromkeys( tuple( exclude ) for exclude in excludeS ) ]
+
+# Returns the long-format table (code, country, exclude, pf_eigenvalue) for every country and exclude.
+#   cache maps frozenset( exclude ) to a Series of pf_eigenvalues by code;
+#   it is filled in place, so repeated sweeps only solve the new (country, exclude) pairs.
+def pf_eigenvalue_sweep( codeS, countryS, matrix0S, excludeS, cache=None ):
+    if cache is None:
+        cache = dict()
+    n = matrix0S.shape[ 1 ]
+    matrix0S = np.asarray( matrix0S, dtype=float )
+    index = pd.Index( codeS )
+    # Groups the excludes by the number of strata kept, with the countries still to solve (rows of codeS).
+    k2todoS = dict()
+    for frozen in dict.fromkeys( frozenset( exclude ) for exclude in excludeS ):
+        cS = np.arange( len( codeS ) ) if frozen not in cache else np.flatnonzero( ~index.isin( cache[ frozen ].index ) )
+        if len( cS ):
+            keepS = [ i for i in range( n ) if i not in frozen ]
+            k2todoS.setdefault( len( keepS ), [] ).append( ( frozen, keepS, cS ) )
+    for ( k, todoS ) in k2todoS.items():
+        # Stacks the submatrices of the same size into eigen solves of at most BATCH entries.
+        step = max( 1, BATCH // max( 1, len( codeS ) * k * k ) )
+        for start in range( 0, len( todoS ), step ):
+            batchS = todoS[ start:start + step ]
+            if k > 0:
+                eigvalS = pf_eigvals( np.concatenate( [ matrix0S[ np.ix_( cS, keepS, keepS ) ] for ( _, keepS, cS ) in batchS ] ) )
+            else:
+                eigvalS = np.full( sum( len( cS ) for ( _, _, cS ) in batchS ), np.nan )
+            offset = 0
+            for ( frozen, _, cS ) in batchS:
+                solved = pd.Series( eigvalS[ offset:offset + len( cS ) ], index=index if len( cS ) == len( codeS ) else index[ cS ] )
+                cache[ frozen ] = solved if frozen not in cache else pd.concat( [ cache[ frozen ], solved ] )
+                offset += len( cS )
+    pf_eigenvalueS = [ cache[ frozen ].reindex( index ).to_numpy() for frozen in ( frozenset( exclude ) for exclude in excludeS ) ]
+    return pd.DataFrame( { 'ISO-alpha3 Code': np.tile( np.asarray( codeS, dtype=object ), len( excludeS ) ),
+                           'country': np.tile( np.asarray( countryS, dtype=object ), len( excludeS ) ),
+                           'exclude': np.repeat( [ dumps( sorted( set( exclude ) ) ) for exclude in excludeS ], len( codeS ) ),
+                           'pf_eigenvalue': np.concatenate( pf_eigenvalueS ) if pf_eigenvalueS else np.zeros( 0 ) } )
+
+# Returns the Perron-Frobenius eigenvalues of a stack of nonnegative matrices from one batched full eigen solve,
+#   as perron_frobenius_eigvals() in prem_matrices_to_pf_eigenvalue.py (which imports this module).
+def pf_eigvals( matrixS ):
+    return np.linalg.eigvals( matrixS ).real.max( axis=-1 )
+
+# Returns the dominant eigenvalues and positive eigenvectors (summing to 1) of a stack of nonnegative matrices,
+#   by batched power iteration from vecS, with a full eigen solve for any matrix that has not converged.
+#   A periodic matrix oscillates and a nilpotent one vanishes; neither converges, so both are solved in full.
+def dominant_eig( matrixS, vecS, tolerance=TOLERANCE, max_iteration=MAX_ITERATION ):
+    vecS = vecS / vecS.sum( axis=1, keepdims=True )
+    eigvalS = np.zeros( len( matrixS ) )
+    changeS = np.full( len( matrixS ), np.inf )
+    activeS = np.arange( len( matrixS ) )
+    for iteration in range( max_iteration ):
+        if len( activeS ) == 0:
+            break
+        nextS = np.einsum( 'nij,nj->ni', matrixS[ activeS ], vecS[ activeS ] )
+        # For a vector summing to 1, the sum of A v converges to the eigenvalue.
+        eigvalS[ activeS ] = nextS.sum( axis=1 )
+        with np.errstate( divide='ignore', invalid='ignore' ):
+            nextS /= eigvalS[ activeS, np.newaxis ]
+            changes = np.abs( nextS - vecS[ activeS ] ).max( axis=1 )
+            # Estimates the remaining error from the geometric rate of convergence,
+            #   so a slow start (e.g., a nearly reducible matrix) is not mistaken for convergence.
+            rateS = changes / changeS[ activeS ]
+            convergedS = ( changes == 0.0 ) | ( ( rateS < 1.0 ) & ( changes < tolerance * ( 1.0 - rateS ) ) )
+        changeS[ activeS ] = changes
+        vecS[ activeS ] = nextS
+        activeS = activeS[ ~convergedS ]
+    for a in activeS:
+        vals, vecs = np.linalg.eig( matrixS[ a ] )
+        maxcol = np.argmax( vals.real )
+        eigvalS[ a ] = vals[ maxcol ].real
+        vecS[ a ] = np.abs( vecs[ :, maxcol ].real ) / np.abs( vecs[ :, maxcol ].real ).sum()
+    return eigvalS, vecS
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Checks pf_eigenvalue_sweep and dominant_eig against np.linalg.eigvals, including matrices on which power iteration does not converge.
+
+Run with "python -m pytest" from this directory.
+"""
+
+# Import libraries
+import warnings
+import numpy as np
+from prem_matrices_to_pf_eigenvalue_sweep import dominant_eig, pf_eigenvalue_sweep, sweep_excludes
+
+# Returns the largest real part of the eigenvalues of each matrix in the stack matrixS.
+def eigvals_max( matrixS ):
+    return np.linalg.eigvals( matrixS ).real.max( axis=-1 )
+
+# A periodic matrix makes power iteration oscillate, so its eigenvalue must come from the full solve.
+def test_periodic():
+    matrixS = np.array( [ [ [ 0.0, 2.0 ], [ 1.0, 0.0 ] ] ] )
+    ( eigvalS, vecS ) = dominant_eig( matrixS, np.ones( ( 1, 2 ) ) )
+    assert np.allclose( eigvalS, [ np.sqrt( 2.0 ) ], rtol=1.0e-12 )
+    assert np.allclose( matrixS[ 0 ] @ vecS[ 0 ], eigvalS[ 0 ] * vecS[ 0 ], rtol=1.0e-12 )
+
+# The periodic block left after an exclude dominates the remaining stratum.
+def test_sweep_periodic_exclude():
+    matrix0S = np.array( [ [ [ 0.0, 2.0, 0.0 ], [ 1.0, 0.0, 0.0 ], [ 0.0, 0.0, 0.5 ] ] ] )
+    df = pf_eigenvalue_sweep( [ 'AAA' ], [ 'A' ], matrix0S, [ [ 2 ] ] )
+    assert np.isclose( df[ "pf_eigenvalue" ].iloc[ 0 ], np.sqrt( 2.0 ), rtol=1.0e-12 )
+
+# Zero and nilpotent matrices have eigenvalue 0 and raise no warning.
+def test_nilpotent():
+    matrixS = np.array( [ np.zeros( ( 3, 3 ) ), np.diag( [ 1.0, 1.0 ], k=1 ) ] )
+    with warnings.catch_warnings():
+        warnings.simplefilter( 'error' )
+        ( eigvalS, _ ) = dominant_eig( matrixS, np.ones( ( 2, 3 ) ) )
+    assert np.allclose( eigvalS, 0.0 )
+
+# Sparse random matrices are often reducible or imprimitive.
+def test_sparse_random():
+    rng = np.random.default_rng( 0 )
+    matrixS = rng.random( ( 500, 8, 8 ) ) * ( rng.random( ( 500, 8, 8 ) ) < 0.2 )
+    ( eigvalS, _ ) = dominant_eig( matrixS, np.ones( ( 500, 8 ) ) )
+    assert np.allclose( eigvalS, eigvals_max( matrixS ), rtol=1.0e-10, atol=1.0e-12 )
+
+# A sweep filling a cache from a subset of the countries gives the eigenvalues of a sweep from scratch.
+def test_sweep_cache():
+    rng = np.random.default_rng( 1 )
+    matrix0S = rng.random( ( 6, 5, 5 ) ) * ( rng.random( ( 6, 5, 5 ) ) < 0.5 )
+    codeS = [ f'C{c}' for c in range( 6 ) ]
+    excludeS = sweep_excludes( 'prefixes,bands', 5 )
+    cache = dict()
+    pf_eigenvalue_sweep( codeS[ :3 ], codeS[ :3 ], matrix0S[ :3 ], excludeS[ :4 ], cache )
+    df = pf_eigenvalue_sweep( codeS, codeS, matrix0S, excludeS, cache )
+    keepSS = [ [ i for i in range( 5 ) if i not in exclude ] for exclude in excludeS ]
+    expectS = np.concatenate( [ eigvals_max( matrix0S[ :, keepS ][ :, :, keepS ] ) for keepS in keepSS ] )
+    assert list( df[ "ISO-alpha3 Code" ] ) == codeS * len( excludeS )
+    assert np.allclose( df[ "pf_eigenvalue" ], expectS, rtol=1.0e-12, atol=1.0e-14 )
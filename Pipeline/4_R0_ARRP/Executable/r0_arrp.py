@@ -9,106 +9,223 @@ from sys import exit
 from os.path import exists, isfile
 from os import mkdir, remove
 
+import numpy as np
 import pandas as pd
-from json import load
+from json import load, loads, dumps
+
+from r0_arrp_monte_carlo import r0_quantiles
+from r0_arrp_ngm import intervention_vectors, ngm_table
+from r0_arrp_history import append_run_, frame_sha256_
+from hashlib import sha256
+import sys
+from os.path import abspath, dirname
+sys.path.insert( 0, dirname( dirname( dirname( abspath( __file__ ) ) ) ) ) # Pipeline/ holds instrument.py
+from instrument import add_arguments, instrumented, span
 
 def main(): 
     parser = getArguments()
     argument = parser.parse_args()
     check( argument )  
 
-    # Reads parameters for the gamma distribution of generation time.
-    with open( f'{argument.idir}{argument.generation_time}' ) as iFH:
-        gammas = load( iFH )
-    #print(gammas)
-    gamma = gammas[0]
-    gamma[ "mu" ] = gamma[ "mean" ]
-    gamma[ "kappa" ] = (gamma[ "standard_deviation" ]/ gamma[ "mean" ]) ** 2
+    with instrumented( 'r0_arrp', argument.trace, argument.profile ):
+        # Reads parameters for the gamma distributions of generation time, one per prior.
+        with open( f'{argument.idir}{argument.generation_time}' ) as iFH:
+            gammas = load( iFH )
+        #print(gammas)
     
-    # Loads UN ISO 3166-1 alpha-3 Country Codes from columns in *.csv file.
-    # The UN made errors in columns, so the read needs to specify relevant columns (which are uncorrupted).
-    fields = ['Region Name', 'Sub-region Name', 'ISO-alpha3 Code']
-    df_code = pd.read_csv( f'{argument.code_fn}', skipinitialspace=True, usecols=fields )
-    code2info = df_to_key2dictionary( df_code, 'ISO-alpha3 Code' )
+        # Loads UN ISO 3166-1 alpha-3 Country Codes from columns in *.csv file.
+        # The UN made errors in columns, so the read needs to specify relevant columns (which are uncorrupted).
+        fields = ['Region Name', 'Sub-region Name', 'ISO-alpha3 Code']
+        df_code = pd.read_csv( f'{argument.code_fn}', skipinitialspace=True, usecols=fields )
             
-    # Loads Prem matrix PF eigenvalues from columns in *.csv file.
-    df_eigenvalue = pd.read_csv( f'{argument.eigenvalue_fn}', skipinitialspace=True )
-    code2eigenvalue = df_to_key2dictionary( df_eigenvalue, 'ISO-alpha3 Code' )
+        # Loads Prem matrix PF eigenvalues from columns in *.csv file.
+        df_eigenvalue = pd.read_csv( f'{argument.eigenvalue_fn}', skipinitialspace=True )
             
-    # Loads slopes and related information from columns in *.csv file.
-    df_slope = pd.read_csv( f'{argument.slope_fn}', skipinitialspace=True )
-    code2slope = df_to_key2dictionary( df_slope, 'code' )
-    
-    codes = [ c for c in code2slope if c in code2eigenvalue and c in code2info ]
-    
+        # Loads slopes and related information from columns in *.csv file.
+        df_slope = pd.read_csv( f'{argument.slope_fn}', skipinitialspace=True )
+        r0_( argument, gammas, df_code, df_eigenvalue, df_slope )
+
+# Returns { "code2r0": DataFrame as code2r0.csv (indexed by code), "grid": DataFrame as code2r0_grid.csv,
+#   "ngm": DataFrame as code2r0_ngm.csv or None, "run": the run number in the history or None }.
+#   df_slope and df_eigenvalue are the frames of slope.csv and pf_eigenvalue.csv, read from slope_fn and eigenvalue_fn if not given;
+#   gammas are the generation-time priors, read from generation_time.json if not given;
+#   code2matrix maps code to Prem matrix for --ngm, read from the store matrix_store if not given.
+#   Keywords override the defaults of the command-line arguments (by dest); files are written only if odir is given.
+def run( df_slope=None, df_eigenvalue=None, gammas=None, odir=None, code2matrix=None, **name2value ): 
+    argument = getArguments().parse_args( [] )
+    for ( name, value ) in dict( name2value, odir=odir ).items():
+        if not hasattr( argument, name ):
+            raise TypeError( f'run() got an unexpected argument "{name}".' )
+        setattr( argument, name, value )
+    if not isinstance( argument.quantiles, str ):
+        argument.quantiles = dumps( argument.quantiles )
+    if argument.ngm is not None and not isinstance( argument.ngm, str ):
+        argument.ngm = dumps( [ list( map( float, multiplier ) ) for multiplier in argument.ngm ] )
+    if odir is not None and not exists( f'{odir}' ):
+        mkdir( f'{odir}' )
+    if gammas is None:
+        with open( f'{argument.idir}{argument.generation_time}' ) as iFH:
+            gammas = load( iFH )
+    fields = ['Region Name', 'Sub-region Name', 'ISO-alpha3 Code']
+    df_code = pd.read_csv( f'{argument.code_fn}', skipinitialspace=True, usecols=fields )
+    if df_eigenvalue is None:
+        df_eigenvalue = pd.read_csv( f'{argument.eigenvalue_fn}', skipinitialspace=True )
+    if df_slope is None:
+        df_slope = pd.read_csv( f'{argument.slope_fn}', skipinitialspace=True )
+    return r0_( argument, gammas, df_code, df_eigenvalue, df_slope, code2matrix )
+
+# Calculates R0 (and its quantiles) for every country and generation-time prior, and R under the interventions argument.ngm;
+#   writes code2r0.csv, code2r0_grid.csv (and code2r0_ngm.csv) if argument.odir is not None,
+#   and appends the run to the history argument.history if it is not None.
+#   code2matrix maps code to Prem matrix for argument.ngm; it is read from argument.matrix_store if None.
+def r0_( argument, gammas, df_code, df_eigenvalue, df_slope, code2matrix=None ): 
+    gamma = gammas_to_arrays( gammas )
     print( f'-- combining country values started --', flush=True )
-    code2r0 = {}
-    for c in codes:
-        code2r0[c] = { **code2info[c], **code2slope[c], **code2eigenvalue[c] }
+    with span( 'combine', items=len( df_slope ) ):
+        df = combine( df_code, df_eigenvalue, df_slope )
+    print( f'-- Processing {len( df )} countries and {len( gammas )} generation-time priors started --', flush=True )
     
-    # Calculates R0 and R0_error.
-    for (key,value) in code2r0.items():
-        print( f'-- Processing "{key}" started --', flush=True )
-        # Adds the r0 and r0_error calculated from r.
-        r = value[ "slope" ]
-        delta_r = value[ "error" ]
-        code2r0[ key ][ "r0" ] = float( r0( gamma, r ) )
-        code2r0[ key ][ "r0_error" ] = float( r0_error( gamma, r, delta_r ) )
-        #print( code2r0[ key ], flush=True )
-
-    # Writes dataframe to code2r0.csv.
-    #cols=['code', 'country', 'slope', 'slope_error', 'r0', 'r0_error', 'pf_eigenvalue'...& other deleted matrices ]
-    df = pd.DataFrame.from_dict( code2r0, orient='index' )
+    # Calculates R0 and R0_error for every country and prior as ( countries, priors ) arrays.
+    r = df[ "slope" ].to_numpy( dtype=float )[ :, np.newaxis ]
+    delta_r = df[ "error" ].to_numpy( dtype=float )[ :, np.newaxis ]
+    with span( 'r0', items=len( df ) * len( gammas ) ):
+        r0S = r0( gamma, r )
+        r0_errorS = r0_error( gamma, r, delta_r )
+    # Calculates Monte Carlo quantiles of R0 as a ( countries, priors, quantiles ) array.
+    quantileS = loads( argument.quantiles )
+    quantile_cols = [ f'r0_q{q:g}' for q in quantileS ]
+    if argument.draws > 0:
+        print( f'-- Sampling {argument.draws} draws per country and prior started --', flush=True )
+        with span( 'r0_quantiles', items=len( df ) * len( gammas ) * argument.draws, jobs=argument.jobs ):
+            quantile3S = r0_quantiles( r[ :, 0 ], delta_r[ :, 0 ], gammas, argument.draws, quantileS,
+                                       seed=argument.seed, chunk_size=argument.chunk_size, jobs=argument.jobs )
+
+    # Writes dataframe to code2r0.csv for the 0-th prior.
+    #cols=['code', 'Region Name', 'Sub-region Name', 'country', 'slope', 'error', ..., 'r0', 'r0_error', 'pf_eigenvalue'...& other deleted matrices ]
+    df[ "r0" ] = r0S[ :, 0 ]
+    df[ "r0_error" ] = r0_errorS[ :, 0 ]
+    if argument.draws > 0:
+        for ( k, col ) in enumerate( quantile_cols ):
+            df[ col ] = quantile3S[ :, 0, k ]
     cols = df.columns.tolist()
     # Moves the column names 'pf_eigenvalue*' to the end.
     pfs = [x for x in cols if x.startswith('pf_eigenvalue')] 
     cols = [x for x in cols if not x.startswith('pf_eigenvalue')]
     cols.extend( pfs )
     df = df[ cols ]
-    
-    df.index.name='code'
-    ofn = f'{argument.odir}code2r0.csv'
-    if isfile( ofn ):
-        remove( ofn )
-    df.to_csv( ofn )
-              
-# Returns R0 for given gamma distribution and Malthusian parameter r.    
-def df_to_key2dictionary( df, key ): 
-    dictionaries = df.to_dict( 'records' )
-    key2dictionary = dict()
-    for d in dictionaries:
-        code = d[ key ]
-        del d[ key ]
-        key2dictionary[ code ] = d
-    return key2dictionary
+    if argument.odir is not None:
+        ofn = f'{argument.odir}code2r0.csv'
+        if isfile( ofn ):
+            remove( ofn )
+        df.to_csv( ofn )
+
+    # Writes the country x prior grid to code2r0_grid.csv, one row per country and prior.
+    ( n, m ) = r0S.shape
+    df_grid = pd.DataFrame( { 'code': np.repeat( df.index.to_numpy(), m ),
+                              'country': np.repeat( df[ "country" ].to_numpy(), m ),
+                              'prior': np.tile( np.arange( m ), n ),
+                              'cite': np.tile( [ g.get( "cite" ) for g in gammas ], n ),
+                              'location': np.tile( [ g.get( "location" ) for g in gammas ], n ),
+                              'mean': np.tile( gamma[ "mu" ], n ),
+                              'standard_deviation': np.tile( gamma[ "standard_deviation" ], n ),
+                              'slope': np.repeat( r[ :, 0 ], m ),
+                              'error': np.repeat( delta_r[ :, 0 ], m ),
+                              'r0': r0S.ravel(),
+                              'r0_error': r0_errorS.ravel() } )
+    if argument.draws > 0:
+        for ( k, col ) in enumerate( quantile_cols ):
+            df_grid[ col ] = quantile3S[ :, :, k ].ravel()
+    if argument.odir is not None:
+        ofn = f'{argument.odir}code2r0_grid.csv'
+        if isfile( ofn ):
+            remove( ofn )
+        df_grid.to_csv( ofn, index=False )
+
+    # Calculates R under each intervention from the next-generation matrices of the 0-th prior's R0.
+    df_ngm = None
+    if argument.ngm is not None:
+        if code2matrix is None:
+            code2matrix = load_matrix_store( argument.matrix_store )
+        multiplierS = intervention_vectors( argument.ngm, len( next( iter( code2matrix.values() ) ) ), argument.seed )
+        print( f'-- Solving {len( multiplierS )} interventions per country started --', flush=True )
+        with span( 'ngm', items=len( df ) * len( multiplierS ) ):
+            df_ngm = ngm_table( df, code2matrix, multiplierS )
+        if argument.odir is not None:
+            ofn = f'{argument.odir}code2r0_ngm.csv'
+            if isfile( ofn ):
+                remove( ofn )
+            df_ngm.to_csv( ofn, index=False )
+
+    # Appends the run, tagged by its parameters and the hashes of its inputs, to the history of all runs.
+    run = None
+    if argument.history is not None:
+        parameters = { name: getattr( argument, name ) for name in [ "generation_time", "slope_fn", "eigenvalue_fn", "draws", "quantiles", "seed" ] }
+        name2sha256 = { "slope": frame_sha256_( df_slope ), "eigenvalue": frame_sha256_( df_eigenvalue ), "code": frame_sha256_( df_code ),
+                        "generation_time": sha256( dumps( gammas, sort_keys=True ).encode() ).hexdigest() }
+        with span( 'history', items=len( df_grid ) ):
+            run = append_run_( argument.history, parameters, name2sha256, df, df_grid )
+        print( f'-- Appended run {run} to "{argument.history}" --', flush=True )
+    return { "code2r0": df, "grid": df_grid, "ngm": df_ngm, "run": run }
+
+# Returns the dictionary from code to Prem matrix in the binary store [fbn].npy and [fbn].json of 1_Prem_Matrices_to_df/.
+def load_matrix_store( fbn ): 
+    with open( f'{fbn}.json' ) as iFH:
+        index = load( iFH )
+    matrix0S = np.load( f'{fbn}.npy', mmap_mode='r' )
+    return { code: matrix0S[ i ] for ( i, code ) in enumerate( index[ "codes" ] ) }
+
+# Returns the gamma parameters of the generation-time priors gammas as arrays indexed by prior.
+def gammas_to_arrays( gammas ): 
+    mean = np.array( [ g[ "mean" ] for g in gammas ], dtype=float )
+    standard_deviation = np.array( [ g[ "standard_deviation" ] for g in gammas ], dtype=float )
+    return { "mu": mean, "kappa": ( standard_deviation / mean ) ** 2, "standard_deviation": standard_deviation }
+
+# Returns the countries in slope, eigenvalue and region tables (joined on code, in slope order) indexed by 'code'.
+#   The country name comes from the eigenvalue table.
+def combine( df_code, df_eigenvalue, df_slope ): 
+    df_slope = df_slope.set_index( 'code' )
+    df_eigenvalue = df_eigenvalue.set_index( 'ISO-alpha3 Code' )
+    df_code = df_code.dropna( subset=[ 'ISO-alpha3 Code' ] ).set_index( 'ISO-alpha3 Code' )
+    df = df_slope.drop( columns=[ 'country' ] ).join( df_eigenvalue, how='inner' ).join( df_code, how='inner' )
+    pf_cols = [ x for x in df_eigenvalue.columns if x != 'country' ]
+    df = df[ list( df_code.columns ) + list( df_slope.columns ) + pf_cols ]
+    df.index.name = 'code'
+    return df
 
 # Returns R0 for given gamma distribution and Malthusian parameter r.    
+#   Scalars or arrays broadcast, e.g., r[:, np.newaxis] against arrays of priors gives a ( countries, priors ) grid.
+#   For r below -1/(mu*kappa), where the gamma moment generating function diverges, R0 is taken at its limit 0, as in r0_arrp_monte_carlo.py.
 def r0( gamma, r ): 
-    return pow( 1.0 + r * gamma["mu"] * gamma["kappa"], 1.0/gamma["kappa"] ) 
+    return np.power( np.maximum( 1.0 + r * gamma["mu"] * gamma["kappa"], 0.0 ), 1.0/gamma["kappa"] ) 
 
 # Returns absolute error in R0 for given gamma distribution and Malthusian parameter r.    
+#   Where R0 is clamped at 0 (see r0), it does not vary with r, so its error is 0.
 def r0_error( gamma, r, delta_r ): 
-    return delta_r * gamma["mu"] * pow( 1.0 + r * gamma["mu"] * gamma["kappa"], 1.0/gamma["kappa"] - 1.0 ) 
+    base = 1.0 + r * gamma["mu"] * gamma["kappa"]
+    return np.where( base <= 0.0, 0.0, delta_r * gamma["mu"] * np.power( np.where( base <= 0.0, 1.0, base ), 1.0/gamma["kappa"] - 1.0 ) ) 
 
 # Checks and fixes arguments if possible.    
 def check( argument ): 
     if not exists( f'{argument.idir}' ):
         print( f'Error: a valid INPUT_DIRECTORY "{argument.idir}" is required.' )
-        exit
+        exit(1)
     if not exists( f'{argument.odir}' ):
         mkdir( f'{argument.odir}' )
     if not isfile( f'{argument.idir}{argument.generation_time}' ):
         print( f'Error: a valid GENERATION_TIME "{argument.idir}{argument.generation_time}" is required.' )
-        exit
+        exit(1)
     if not isfile( f'{argument.code_fn}' ):
         print( f'Error: a valid CODE_FN "{argument.code_fn}" is required.' )
-        exit
+        exit(1)
     if not isfile( f'{argument.eigenvalue_fn}' ):
         print( f'Error: a valid EIGENVALUE_FN "{argument.eigenvalue_fn}" is required.' )
-        exit
+        exit(1)
     if not isfile( f'{argument.slope_fn}' ):
         print( f'Error: a valid SLOPE_FN "{argument.slope_fn}" is required.' )
-        exit
+        exit(1)
+    if argument.ngm is not None and not ( isfile( f'{argument.matrix_store}.npy' ) and isfile( f'{argument.matrix_store}.json' ) ):
+        print( f'Error: a valid MATRIX_STORE "{argument.matrix_store}" is required by --ngm.' )
+        exit(1)
     
 def getArguments():
     parser = argparse.ArgumentParser(description='The program outputs Perron-Frobenius eigenvalue for prem matrices by country as csv.\n')
@@ -116,7 +233,7 @@ def getArguments():
                         help="INPUT_DIRECTORY", metavar="INPUT_DIRECTORY")
     parser.add_argument("-o", "--odir", dest="odir", default="../Output/", 
                         help="OUTPUT_DIRECTORY", metavar="OUTPUT_DIRECTORY")
-    parser.add_argument("-g", "--generation_time", dest="generation_time", default="generation_time.json", # generation_time gamma parameters The 0-th element is used.
+    parser.add_argument("-g", "--generation_time", dest="generation_time", default="generation_time.json", # generation_time gamma parameters The 0-th element is used for code2r0.csv; every element for code2r0_grid.csv.
                         help="GENERATION_TIME", metavar="GENERATION_TIME")
     parser.add_argument("-c", "--code_fn", dest="code_fn", # *.csv with code to country
                         help="CODE_FN", metavar="CODE_FN")
@@ -124,6 +241,23 @@ def getArguments():
                         help="EIGENVALUE_FN", metavar="EIGENVALUE_FN")
     parser.add_argument("-s", "--slope_fn", dest="slope_fn", 
                         help="SLOPE_FN", metavar="SLOPE_FN")
+    parser.add_argument("-n", "--draws", dest="draws", type=int, default=0, # Monte Carlo draws of R0 per country and prior; 0 skips the quantile columns.
+                        help="DRAWS", metavar="DRAWS")
+    parser.add_argument("-q", "--quantiles", dest="quantiles", default="[0.025,0.5,0.975]", # JSON list of R0 quantiles written as columns r0_q[quantile]
+                        help="QUANTILES", metavar="QUANTILES")
+    parser.add_argument("--seed", dest="seed", type=int, default=0, # seed of the Monte Carlo draws
+                        help="SEED", metavar="SEED")
+    parser.add_argument("--chunk_size", dest="chunk_size", type=int, default=1 << 18, # draws sampled at once; a cell with more DRAWS is replayed over a few passes, so memory does not grow with DRAWS
+                        help="CHUNK_SIZE", metavar="CHUNK_SIZE")
+    parser.add_argument("--jobs", dest="jobs", type=int, default=1, # worker processes for the Monte Carlo draws
+                        help="JOBS", metavar="JOBS")
+    parser.add_argument("-m", "--matrix_store", dest="matrix_store", default="../../1_Prem_Matrices_to_df/Output/prem_matrices", # basename of the *.npy/*.json Prem matrix store
+                        help="MATRIX_STORE", metavar="MATRIX_STORE")
+    parser.add_argument("--ngm", dest="ngm", default=None, # JSON list of contact multipliers by stratum or keywords removals,reductions,random:N; writes code2r0_ngm.csv
+                        help="NGM", metavar="NGM")
+    parser.add_argument("--history", dest="history", default=None, # SQLite file to which every run's results are appended, tagged by parameters and input hashes
+                        help="HISTORY_FN", metavar="HISTORY_FN")
+    add_arguments( parser )
     return parser
     
 if __name__ == "__main__":
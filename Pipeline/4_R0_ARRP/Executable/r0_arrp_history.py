@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Keeps the results of every r0_arrp.py run in one SQLite file, instead of only the latest code2r0.csv.
+
+A run records its date, parameters and the sha256 hashes of its inputs (slope, eigenvalue, code and generation-time tables);
+  its results hold one row per country, slope window (start_date, end_date) and generation-time prior,
+  with the region, slope, R0 and pf_eigenvalue, so a slope_rolling.csv run keeps every window of a country.
+Indexes on code, region, sub-region (each with prior and run) and on the run date
+  answer queries such as the R0 trajectory of a region across runs without reading any *.csv file.
+"""
+
+# Import libraries
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from hashlib import sha256
+from json import dumps, loads
+import numpy as np
+import pandas as pd
+
+SCHEMA = [ '''CREATE TABLE IF NOT EXISTS runs ( run INTEGER PRIMARY KEY, date TEXT, parameters TEXT,
+                  slope_sha256 TEXT, eigenvalue_sha256 TEXT, code_sha256 TEXT, generation_time_sha256 TEXT )''',
+           '''CREATE TABLE IF NOT EXISTS results ( run INTEGER, code TEXT, prior INTEGER, start_date TEXT, end_date TEXT, country TEXT, region TEXT, sub_region TEXT,
+                  slope REAL, error REAL, r0 REAL, r0_error REAL, pf_eigenvalue REAL, PRIMARY KEY ( run, code, start_date, end_date, prior ) )''',
+           '''CREATE INDEX IF NOT EXISTS results_code ON results ( code, prior, run )''',
+           '''CREATE INDEX IF NOT EXISTS results_region ON results ( region, prior, run )''',
+           '''CREATE INDEX IF NOT EXISTS results_sub_region ON results ( sub_region, prior, run )''',
+           '''CREATE INDEX IF NOT EXISTS runs_date ON runs ( date )''' ]
+
+COLS = [ 'run', 'date', 'code', 'prior', 'start_date', 'end_date', 'country', 'region', 'sub_region', 'slope', 'error', 'r0', 'r0_error', 'pf_eigenvalue' ]
+
+# Returns the sha256 hex digest of a table's content (as *.csv text), the same whether it was read from a file or passed in memory.
+def frame_sha256_( df ):
+    return sha256( df.to_csv( index=False ).encode() ).hexdigest()
+
+# Appends a run to the history fn (created if absent) in one transaction, so a failed run leaves no trace; returns the run number.
+#   df is code2r0.csv (indexed by code, with 'Region Name', 'Sub-region Name', 'country', 'start_date', 'end_date', 'pf_eigenvalue'),
+#   df_grid is code2r0_grid.csv (the rows of df, each repeated once per prior); name2sha256 holds the input hashes by table name.
+def append_run_( fn, parameters, name2sha256, df, df_grid, date=None ):
+    date = date if date is not None else datetime.now().isoformat( timespec='seconds' )
+    m = len( df_grid ) // len( df ) if len( df ) else 0
+    with closing( sqlite3.connect( fn ) ) as connection, connection:
+        for statement in SCHEMA:
+            connection.execute( statement )
+        cursor = connection.execute( 'INSERT INTO runs VALUES ( NULL, ?, ?, ?, ?, ?, ? )',
+                                     ( date, dumps( parameters, sort_keys=True ), name2sha256.get( "slope" ), name2sha256.get( "eigenvalue" ),
+                                       name2sha256.get( "code" ), name2sha256.get( "generation_time" ) ) )
+        run = cursor.lastrowid
+        codeS = df_grid[ "code" ].to_numpy()
+        # Converts NumPy scalars to Python numbers and NaN to NULL.
+        def column( values ):
+            return [ None if pd.isna( value ) else value for value in np.asarray( values ).tolist() ]
+        # Repeats a column of df along the rows of df_grid; a code may occur in several rows (windows) of df.
+        def repeat( col ):
+            return column( np.repeat( df[ col ].to_numpy() if col in df.columns else np.full( len( df ), np.nan ), m ) )
+        rowS = zip( [ run ] * len( codeS ), column( codeS ), column( df_grid[ "prior" ] ), repeat( "start_date" ), repeat( "end_date" ),
+                    column( df_grid[ "country" ] ), repeat( "Region Name" ), repeat( "Sub-region Name" ),
+                    column( df_grid[ "slope" ] ), column( df_grid[ "error" ] ), column( df_grid[ "r0" ] ), column( df_grid[ "r0_error" ] ),
+                    repeat( "pf_eigenvalue" ) )
+        connection.executemany( 'INSERT INTO results VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? )', rowS )
+    return run
+
+# Returns the runs in the history fn as a DataFrame (run, date, parameters as a dict, input hashes), oldest first.
+def read_runs_( fn ):
+    with closing( sqlite3.connect( fn ) ) as connection:
+        df = pd.read_sql_query( 'SELECT * FROM runs ORDER BY date, run', connection )
+    df[ "parameters" ] = df[ "parameters" ].map( loads )
+    return df
+
+# Returns the results of every run for prior, selected by code, region and sub_region (each a value or a list; None selects all)
+#   and by the run dates since and until (ISO text), as a DataFrame with columns COLS ordered by date, run, code and window.
+def r0_history_( fn, code=None, region=None, sub_region=None, prior=0, since=None, until=None ):
+    ( where, valueS ) = where_( code, region, sub_region, prior, since, until )
+    query = ( f'SELECT {", ".join( "runs.date" if col == "date" else f"results.{col}" for col in COLS )} '
+              f'FROM results JOIN runs ON results.run = runs.run WHERE {where} ORDER BY runs.date, results.run, results.code, results.start_date' )
+    with closing( sqlite3.connect( fn ) ) as connection:
+        return pd.DataFrame.from_records( connection.execute( query, valueS ).fetchall(), columns=COLS )
+
+# Returns the R0 trajectory of the countries selected as in r0_history_() (e.g., a region) across runs for prior:
+#   one row per run with its date, the number of results (countries and windows) and the mean, minimum and maximum of R0, aggregated by SQLite.
+def region_trajectory_( fn, code=None, region=None, sub_region=None, prior=0, since=None, until=None ):
+    ( where, valueS ) = where_( code, region, sub_region, prior, since, until )
+    query = ( 'SELECT results.run, runs.date, COUNT( results.r0 ), AVG( results.r0 ), MIN( results.r0 ), MAX( results.r0 ) '
+              f'FROM results JOIN runs ON results.run = runs.run WHERE {where} GROUP BY results.run ORDER BY runs.date, results.run' )
+    with closing( sqlite3.connect( fn ) ) as connection:
+        return pd.DataFrame.from_records( connection.execute( query, valueS ).fetchall(), columns=[ 'run', 'date', 'countries', 'mean', 'min', 'max' ] )
+
+# Returns the WHERE clause and its values selecting prior, code, region, sub_region and the run dates since and until.
+def where_( code, region, sub_region, prior, since, until ):
+    whereS = [ 'results.prior = ?' ]
+    valueS = [ prior ]
+    for ( col, selection ) in ( ( 'results.code', code ), ( 'results.region', region ), ( 'results.sub_region', sub_region ) ):
+        if selection is None:
+            continue
+        selectionS = [ selection ] if isinstance( selection, str ) else list( selection )
+        whereS.append( f'{col} IN ( {", ".join( "?" * len( selectionS ) )} )' )
+        valueS.extend( selectionS )
+    if since is not None:
+        whereS.append( 'runs.date >= ?' )
+        valueS.append( since )
+    if until is not None:
+        whereS.append( 'runs.date <= ?' )
+        valueS.append( until )
+    return " AND ".join( whereS ), valueS
@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 
-from os import system
+from sys import exit
+from os import system, waitstatus_to_exitcode
 
 log = f'r0_arrp.log'
 
 C = ' -c ../../1_Prem_Matrices_to_df/Data/UNSDMethodology.csv'
 E = ' -e ../../3_Prem_Matrices_to_PF_Eigenvalue/Output/pf_eigenvalue.csv'
 S = ' -s ../../2_ARRP/Output/slope.csv'
+N = ' -n 100000'
+G = ' -m ../../1_Prem_Matrices_to_df/Output/prem_matrices --ngm removals'
+H = ' --history ../Output/code2r0_history.sqlite'
 
-system( f'r0_arrp.py {C} {E} {S} > {log}' )
+exit( waitstatus_to_exitcode( system( f'python r0_arrp.py {C} {E} {S} {N} {G} {H} > {log}' ) ) )
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Monte Carlo quantiles of R0 by country and generation-time prior.
+
+Each draw samples r ~ N(slope, error) and, for a prior with "mean_error" or "standard_deviation_error",
+  the gamma mean and standard deviation from normals truncated at 0; R0 follows from r0( gamma, r ).
+Each (country, prior) cell has its own random streams, seeded by (seed, country, prior),
+  so the quantiles depend neither on chunk_size nor on the number of processes.
+A cell with more than chunk_size draws never holds them all: its streams are replayed,
+  and histograms over a few passes narrow the order statistics of the quantiles down to at most chunk_size draws,
+  which are then sorted. The quantiles are exact, as np.quantile of all the draws.
+"""
+
+# Import libraries
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.special import ndtr, ndtri
+
+CHUNK_SIZE = 1 << 18 # draws sampled at once, bounding the memory of the temporaries and of the order-statistic search
+BINS = 1 << 12 # histogram bins per pass of the order-statistic search
+QUANTILES = [ 0.025, 0.5, 0.975 ]
+
+# Returns the ( countries, priors, quantiles ) array of R0 quantiles from draws samples per country and prior.
+#   slopeS and errorS hold r and its standard deviation by country; gammas are the entries of generation_time.json.
+def r0_quantiles( slopeS, errorS, gammas, draws, quantileS=QUANTILES, seed=0, chunk_size=CHUNK_SIZE, jobs=1 ):
+    cellS = [ ( c, p ) for c in range( len( slopeS ) ) for p in range( len( gammas ) ) ]
+    argumentS = [ ( float( slopeS[ c ] ), float( errorS[ c ] ), gammas[ p ], draws, quantileS, ( seed, c, p ), chunk_size ) for ( c, p ) in cellS ]
+    if jobs > 1 and len( cellS ) > 1:
+        with ProcessPoolExecutor( max_workers=jobs ) as executor:
+            resultS = list( executor.map( cell_quantiles_, argumentS, chunksize=max( 1, len( cellS ) // ( 4 * jobs ) ) ) )
+    else:
+        resultS = [ cell_quantiles_( argument ) for argument in argumentS ]
+    quantile3S = np.full( ( len( slopeS ), len( gammas ), len( quantileS ) ), np.nan )
+    for ( ( c, p ), result ) in zip( cellS, resultS ):
+        quantile3S[ c, p ] = result
+    return quantile3S
+
+# Returns the R0 quantiles of one ( country, prior ) cell; the argument is a tuple so the cell can be sent to a process pool.
+def cell_quantiles_( argument ):
+    ( slope, error, gamma, draws, quantileS, key, chunk_size ) = argument
+    if not ( np.isfinite( slope ) and np.isfinite( error ) ):
+        return np.full( len( quantileS ), np.nan )
+    quantileS = np.asarray( quantileS, dtype=float )
+    # Positions of the quantiles among the sorted draws, computed as by np.quantile's default (linear) method.
+    positionS = ( draws - 1 ) * quantileS
+    lowS = np.clip( np.floor( positionS ).astype( np.int64 ), 0, draws - 1 )
+    highS = np.minimum( lowS + 1, draws - 1 )
+    rank2value = order_statistics_( partial( r0_chunks_, slope, error, gamma, draws, key, chunk_size ), draws, np.union1d( lowS, highS ), chunk_size )
+    # Interpolates between the two order statistics with the rounding of np.quantile.
+    aS = np.array( [ rank2value[ low ] for low in lowS ] )
+    bS = np.array( [ rank2value[ high ] for high in highS ] )
+    tS = np.where( lowS < draws - 1, positionS - lowS, 0.0 )
+    return np.where( tS < 0.5, aS + ( bS - aS ) * tS, bS - ( bS - aS ) * ( 1.0 - tS ) )
+
+# Yields the R0 draws of one cell, chunk_size at a time; every call restarts the cell's streams, so it yields the same draws.
+def r0_chunks_( slope, error, gamma, draws, key, chunk_size ):
+    # Separate streams for r, mean and standard deviation keep every stream's draws independent of chunk_size.
+    r_rng, mean_rng, sd_rng = [ np.random.default_rng( s ) for s in np.random.SeedSequence( list( key ) ).spawn( 3 ) ]
+    mean_error = gamma.get( "mean_error", 0.0 )
+    sd_error = gamma.get( "standard_deviation_error", 0.0 )
+    for start in range( 0, draws, chunk_size ):
+        size = min( chunk_size, draws - start )
+        r = r_rng.normal( slope, error, size )
+        mean = truncated_normal( mean_rng, gamma[ "mean" ], mean_error, size )
+        sd = truncated_normal( sd_rng, gamma[ "standard_deviation" ], sd_error, size )
+        yield r0_draws( mean, sd, r )
+
+# Returns { rank: value } for the order statistics rankS (0-based) of the draws draws yielded by chunks(),
+#   keeping about limit draws per rank in memory. A bracket [ low, high ) around some ranks is sorted once it holds at most limit draws;
+#   otherwise a pass finds the extremes inside it and another counts its draws in BINS bins, the bins holding the ranks becoming the new brackets.
+def order_statistics_( chunks, draws, rankS, limit ):
+    rank2value = dict()
+    bracketS = [ ( -np.inf, np.inf, 0, draws, np.asarray( rankS ) ) ] # ( low, high, draws below low, draws inside, ranks inside )
+    while bracketS:
+        smallS = [ bracket for bracket in bracketS if bracket[ 3 ] <= limit ]
+        largeS = [ bracket for bracket in bracketS if bracket[ 3 ] > limit ]
+        if smallS:
+            valueSS = [ [] for bracket in smallS ]
+            for chunk in chunks():
+                for ( ( low, high, _, _, _ ), valueS ) in zip( smallS, valueSS ):
+                    valueS.append( chunk[ ( low <= chunk ) & ( chunk < high ) ] )
+            for ( ( _, _, below, _, ranks ), valueS ) in zip( smallS, valueSS ):
+                valueS = np.sort( np.concatenate( valueS ) )
+                for rank in ranks:
+                    rank2value[ rank ] = valueS[ rank - below ]
+        bracketS = []
+        if not largeS:
+            continue
+        extremeS = [ [ np.inf, -np.inf ] for bracket in largeS ]
+        for chunk in chunks():
+            for ( ( low, high, _, _, _ ), extreme ) in zip( largeS, extremeS ):
+                inside = chunk[ ( low <= chunk ) & ( chunk < high ) ]
+                if len( inside ):
+                    extreme[ 0 ] = min( extreme[ 0 ], inside.min() )
+                    extreme[ 1 ] = max( extreme[ 1 ], inside.max() )
+        edgeSS = [ np.linspace( minimum, np.nextafter( maximum, np.inf ), BINS + 1 ) for ( minimum, maximum ) in extremeS ]
+        countSS = [ np.zeros( BINS, dtype=np.int64 ) for bracket in largeS ]
+        for chunk in chunks():
+            for ( ( low, high, _, _, _ ), edgeS, countS ) in zip( largeS, edgeSS, countSS ):
+                inside = chunk[ ( low <= chunk ) & ( chunk < high ) ]
+                countS += np.bincount( np.searchsorted( edgeS, inside, side='right' ) - 1, minlength=BINS )
+        for ( ( low, high, below, count, ranks ), ( minimum, maximum ), edgeS, countS ) in zip( largeS, extremeS, edgeSS, countSS ):
+            if minimum == maximum:
+                for rank in ranks:
+                    rank2value[ rank ] = minimum
+                continue
+            belowS = below + np.concatenate( ( [ 0 ], np.cumsum( countS ) ) )
+            binS = np.searchsorted( belowS, ranks, side='right' ) - 1
+            for b in np.unique( binS ):
+                # A bin no narrower than its bracket (draws within a few ulps) is sorted whatever its size.
+                size = countS[ b ] if countS[ b ] < count else 0
+                bracketS.append( ( edgeS[ b ], edgeS[ b + 1 ], belowS[ b ], size, ranks[ binS == b ] ) )
+    return rank2value
+
+# Returns size draws from N(mu, sigma) truncated at 0 (or mu itself when sigma is 0).
+#   Inverting the truncated distribution takes exactly one uniform per draw, so the draws do not depend on how a stream is chunked.
+def truncated_normal( rng, mu, sigma, size ):
+    if sigma == 0.0:
+        return np.full( size, float( mu ) )
+    # Z = ( X - mu ) / sigma > -mu / sigma has the upper tail ndtr( mu / sigma ) of the standard normal.
+    v = ( 1.0 - rng.random( size ) ) * ndtr( mu / sigma )
+    return mu - sigma * ndtri( v )
+
+# Returns R0 for arrays of gamma means, standard deviations and Malthusian parameters r.
+#   For r below -1/(mean*kappa), where the gamma moment generating function diverges, R0 is taken at its limit 0.
+def r0_draws( mean, sd, r ):
+    kappa = ( sd / mean ) ** 2
+    return np.power( np.maximum( 1.0 + r * mean * kappa, 0.0 ), 1.0 / kappa )
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Stratified R under age-targeted interventions, from next-generation matrices built on the Prem matrices.
+
+A country's next-generation matrix is its Prem matrix M scaled so its dominant eigenvalue is the country's R0,
+  K = R0 * M / rho(M).
+An intervention multiplies the contacts of each stratum i by s[i] in [0,1]: s[i] = 0 removes stratum i,
+  s[i] = 1 - f reduces its contacts by the fraction f.
+Its R is rho(diag(s) K); diag(s) K and K diag(s) have the same eigenvalues,
+  so s may equally be read as scaling susceptibility or infectivity, and scaling both by s is the intervention s*s.
+The Rs of all (country, intervention) cells are solved in batches by power iteration,
+  warm-started from the country's Perron-Frobenius eigenvector;
+  the first-order perturbation R0 * (1 - sum_i (1 - s[i]) * elasticity[i]) is returned beside each R.
+"""
+
+# Import libraries
+import sys
+from os.path import abspath, dirname
+from json import loads, dumps
+import numpy as np
+import pandas as pd
+
+sys.path.insert( 0, f'{dirname( dirname( dirname( abspath( __file__ ) ) ) )}/3_Prem_Matrices_to_PF_Eigenvalue/Executable' )
+from prem_matrices_to_pf_eigenvalue_sweep import dominant_eig, FLOOR
+
+BATCH_SIZE = 1 << 14 # (country, intervention) cells solved at once
+REDUCTIONS = [ 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9 ] # fractional contact reductions of the keyword "reductions"
+
+# Returns the ( interventions, n ) array of contact multipliers for an intervention spec:
+#   a JSON list of n-lists of multipliers, or comma-separated keywords
+#   "removals" (each stratum removed), "reductions" (each stratum's contacts reduced by each of REDUCTIONS),
+#   "random:N" (N interventions with multipliers uniform on [0,1], seeded by seed).
+def intervention_vectors( spec, n=16, seed=0 ):
+    spec = spec.strip()
+    if spec.startswith( '[' ):
+        multiplierS = np.array( loads( spec ), dtype=float ).reshape( -1, n )
+    else:
+        vectorS = []
+        for keyword in spec.split( ',' ):
+            keyword = keyword.strip()
+            if keyword == 'removals':
+                vectorS.extend( 1.0 - np.eye( n ) )
+            elif keyword == 'reductions':
+                vectorS.extend( 1.0 - f * np.eye( n )[ i ] for i in range( n ) for f in REDUCTIONS )
+            elif keyword.startswith( 'random:' ):
+                vectorS.extend( np.random.default_rng( seed ).uniform( 0.0, 1.0, ( int( keyword.split( ':' )[ 1 ] ), n ) ) )
+            else:
+                raise ValueError( f'Unknown intervention keyword "{keyword}".' )
+        multiplierS = np.array( vectorS, dtype=float ).reshape( -1, n )
+    if ( multiplierS < 0.0 ).any() or ( multiplierS > 1.0 ).any():
+        raise ValueError( 'Intervention multipliers must lie in [0,1].' )
+    # Removes duplicates, keeping the first occurrence.
+    ( _, firstS ) = np.unique( multiplierS, axis=0, return_index=True )
+    return multiplierS[ np.sort( firstS ) ]
+
+# Returns the Perron-Frobenius eigenvalues, right eigenvectors and elasticities of a stack of Prem matrices.
+#   The elasticity of stratum i, u[i] v[i] / (u . v) for left and right eigenvectors u and v, is d log rho / d log s[i];
+#   the elasticities of a matrix sum to 1.
+def pf_elasticities( matrix0S ):
+    matrix0S = np.asarray( matrix0S, dtype=float )
+    ones = np.ones( matrix0S.shape[ :2 ] )
+    ( eigvalS, rightS ) = dominant_eig( matrix0S, ones.copy() )
+    ( _, leftS ) = dominant_eig( np.transpose( matrix0S, ( 0, 2, 1 ) ).copy(), ones.copy() )
+    productS = leftS * rightS
+    return eigvalS, rightS, productS / productS.sum( axis=1, keepdims=True )
+
+# Returns { "r": R, "r_linear": its first-order perturbation }, ( countries, interventions ) arrays
+#   for countries with R0 r0S and Prem matrices matrix0S under the contact multipliers multiplierS.
+def ngm_r( r0S, matrix0S, multiplierS, batch_size=BATCH_SIZE ):
+    matrix0S = np.asarray( matrix0S, dtype=float )
+    r0S = np.asarray( r0S, dtype=float )
+    ( eigvalS, eigvecS, elasticityS ) = pf_elasticities( matrix0S )
+    ( countries, interventions ) = ( len( matrix0S ), len( multiplierS ) )
+    r_linearS = r0S[ :, np.newaxis ] * ( 1.0 - ( 1.0 - multiplierS ) @ elasticityS.T ).T
+    ratioS = np.zeros( countries * interventions )
+    # Cells are numbered country-major; an intervention removing every stratum has R = 0.
+    cellS = np.flatnonzero( np.tile( multiplierS.any( axis=1 ), countries ) )
+    for start in range( 0, len( cellS ), batch_size ):
+        cell = cellS[ start:start + batch_size ]
+        ( c, k ) = np.divmod( cell, interventions )
+        matrixS = multiplierS[ k, :, np.newaxis ] * matrix0S[ c ]
+        # Starts from the unperturbed eigenvector, zeroed at removed strata and floored elsewhere.
+        vecS = multiplierS[ k ] * eigvecS[ c ]
+        meanS = vecS.sum( axis=1, keepdims=True ) / np.maximum( ( vecS > 0.0 ).sum( axis=1, keepdims=True ), 1 )
+        vecS = np.where( multiplierS[ k ] > 0.0, np.maximum( vecS, FLOOR * meanS ), 0.0 )
+        ( batch_eigvalS, _ ) = dominant_eig( matrixS, vecS )
+        ratioS[ cell ] = batch_eigvalS / eigvalS[ c ]
+    return { "r": r0S[ :, np.newaxis ] * ratioS.reshape( countries, interventions ), "r_linear": r_linearS }
+
+# Returns the long-format table (code, country, intervention, r0, r, r_linear) for every country and intervention.
+#   Countries are those of df (indexed by code, with columns "country" and "r0") with a Prem matrix in code2matrix.
+def ngm_table( df, code2matrix, multiplierS, batch_size=BATCH_SIZE ):
+    df = df[ df.index.isin( list( code2matrix ) ) & np.isfinite( df[ "r0" ].to_numpy( dtype=float ) ) ]
+    codeS = df.index.tolist()
+    matrix0S = np.array( [ code2matrix[ code ] for code in codeS ], dtype=float ).reshape( -1, multiplierS.shape[ 1 ], multiplierS.shape[ 1 ] )
+    r0S = df[ "r0" ].to_numpy( dtype=float )
+    result = ngm_r( r0S, matrix0S, multiplierS, batch_size )
+    m = len( multiplierS )
+    return pd.DataFrame( { 'code': np.repeat( codeS, m ),
+                           'country': np.repeat( df[ "country" ].to_numpy(), m ),
+                           'intervention': np.tile( [ dumps( [ float( s ) for s in multiplier ] ) for multiplier in multiplierS ], len( codeS ) ),
+                           'r0': np.repeat( r0S, m ),
+                           'r': result[ "r" ].ravel(),
+                           'r_linear': result[ "r_linear" ].ravel() } )
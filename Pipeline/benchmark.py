@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+Benchmarks the pipeline steps on synthetic data at multiples of the real country and day counts.
+
+Each benchmark times one stage separately (best of REPEAT runs) and measures its peak traced memory (tracemalloc) in another run.
+The OWID benchmarks run twice per scale, with SCALE x the real countries (axis "countries") and with SCALE x the real days per country (axis "days");
+  the Prem and R0 benchmarks have no days, so they scale the countries only.
+    owid_countries_       streaming decode of an OWID-shaped json file and point extraction
+    build_owid_cache_     conversion of the same json file into the columnar cache
+    owid_cache_countries_ point extraction from the memory-mapped columnar cache
+    arrp_                 asymptotic regression of the extracted points
+    perron_frobenius_eig  scalar eigen solve per Prem-shaped matrix, SCALE x the real countries
+    perron_frobenius_eigvals  batched eigen solve of the same matrices, with the make's excludes
+    pf_eigenvalue_sweep   exclusion sweep over every prefix and contiguous band of strata
+    r0_arrp               joins of slope, eigenvalue and region tables and R0 over the grid, SCALE x the real countries
+The synthetic json file of each shape is written once to a temporary directory and removed at the end.
+Each run appends a record (version, date, library versions, results) to the JSON file, so throughput can be tracked across versions.
+"""
+
+# Import libraries
+import argparse
+import sys
+import platform
+import tracemalloc
+from os import stat
+from os.path import abspath, dirname, isfile
+from json import load, dump, dumps
+from tempfile import TemporaryDirectory
+from subprocess import run as subprocess_run, PIPE, DEVNULL
+from time import perf_counter
+from datetime import datetime, timezone
+from itertools import product
+from string import ascii_uppercase
+import numpy as np
+import pandas as pd
+
+pipeline = f'{dirname( abspath( __file__ ) )}/'
+for directory in [ '2_ARRP/', '3_Prem_Matrices_to_PF_Eigenvalue/', '4_R0_ARRP/' ]:
+    sys.path.insert( 0, f'{pipeline}{directory}Executable' )
+
+import arrp_countries
+from arrp import arrp_
+from arrp_countries_owid import owid_countries_, owid_cache_countries_, build_owid_cache_
+import prem_matrices_to_pf_eigenvalue
+from prem_matrices_to_pf_eigenvalue_sweep import sweep_excludes, pf_eigenvalue_sweep
+import r0_arrp
+
+ofn = f'{pipeline}benchmark.json'
+
+# Real counts, as of the OWID and Prem data in Data/
+OWID_COUNTRIES = 190 # countries in owid-covid-data.json
+OWID_DAYS = 341 # days from 2020-01-01 to 2020-12-06
+PREM_COUNTRIES = 152 # Prem matrices
+R0_COUNTRIES = 131 # countries in code2r0.csv
+STRATA = 16
+
+# Parameters of arrp_countries_make.py and prem_matrices_to_pf_eigenvalue_make.py
+name2arrp = { "new_cases": "new_cases_smoothed", "st_dev_factor": 1.0/np.sqrt(7.0), "threshold": 30, "datum_for_threshold": "new_cases_smoothed" }
+owid_dir = None # temporary directory of the synthetic OWID json files and their caches
+
+excludes = [[0],[0,1],[0,1,2],[0,1,2,3],[0,1,2,3,4],[0,1,2,3,4,5],[0,1,2,3,4,5,6],[0,1,2,3,4,5,6,7]]
+
+def main():
+    parser = getArguments()
+    argument = parser.parse_args()
+    scaleS = [ int( scale ) for scale in argument.scales.split( ',' ) ]
+    resultS = []
+    global owid_dir
+    with TemporaryDirectory( dir=argument.tmp_dir ) as owid_dir:
+        for scale in scaleS:
+            for ( name, benchmark ) in name2benchmark.items():
+                if argument.benchmarks and name not in argument.benchmarks.split( ',' ):
+                    continue
+                for axis in name2axes.get( name, [ 'countries' ] ):
+                    print( f'-- "{name}" at {scale}x {axis} started --', flush=True )
+                    result = benchmark( scale, axis, argument.repeat, np.random.default_rng( argument.seed ) )
+                    result = dict( benchmark=name, scale=scale, axis=axis, **result )
+                    result[ "items_per_second" ] = result[ "items" ] / result[ "seconds" ] if result[ "seconds" ] > 0.0 else None
+                    print( f'-- {result[ "items" ]} items in {result[ "seconds" ]:.4f} secs, peak {result[ "peak_bytes" ]} bytes --', flush=True )
+                    resultS.append( result )
+    runS = []
+    if isfile( argument.ofn ):
+        with open( argument.ofn ) as iFH:
+            runS = load( iFH )
+    runS.append( { "version": version_(), "date": datetime.now( timezone.utc ).isoformat( timespec='seconds' ),
+                   "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+                   "repeat": argument.repeat, "seed": argument.seed, "results": resultS } )
+    with open( argument.ofn, 'w' ) as oFH:
+        dump( runS, oFH, indent=4 )
+
+# Returns the git commit of the pipeline (with "-dirty" for uncommitted changes), or None outside git.
+def version_():
+    try:
+        commit = subprocess_run( [ 'git', 'describe', '--always', '--dirty' ], cwd=pipeline, stdout=PIPE, stderr=DEVNULL, text=True )
+    except OSError:
+        return None
+    return commit.stdout.strip() if commit.returncode == 0 else None
+
+# Returns { "seconds": best of repeat timings of f(), "peak_bytes": peak traced memory of one more call }.
+def measure_( f, repeat ):
+    secondS = []
+    for _ in range( repeat ):
+        start = perf_counter()
+        f()
+        secondS.append( perf_counter() - start )
+    tracemalloc.start()
+    f()
+    ( _, peak ) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return { "seconds": min( secondS ), "peak_bytes": peak }
+
+# Returns the daily records of a synthetic OWID country with days days:
+#   an epidemic wave (exponential rise and fall with Poisson noise) starting at a random day, with deaths a random fraction of cases.
+def owid_country_( rng, days ):
+    dateS = np.datetime64( '2020-01-01' ) + np.arange( days )
+    onset = rng.integers( 0, max( 1, days // 3 ) )
+    t = np.maximum( np.arange( days ) - onset, 0 )
+    mean = np.where( t > 0, np.exp( np.minimum( rng.uniform( 0.05, 0.2 ) * t, 12.0 ) ) * np.exp( -0.01 * t ), 0.0 )
+    new_caseS = rng.poisson( mean ).astype( float )
+    new_deathS = rng.binomial( new_caseS.astype( np.int64 ), rng.uniform( 0.005, 0.03 ) ).astype( float )
+    columnS = []
+    for newS in ( new_caseS, new_deathS ):
+        columnS.extend( [ np.cumsum( newS ), newS, np.convolve( newS, np.ones( 7 ) / 7.0 )[ :days ] ] )
+    return [ { "date": str( date ), "total_cases": float( total_cases ), "new_cases": float( new_cases ), "new_cases_smoothed": float( new_cases_smoothed ),
+               "total_deaths": float( total_deaths ), "new_deaths": float( new_deaths ), "new_deaths_smoothed": float( new_deaths_smoothed ) }
+             for ( date, total_cases, new_cases, new_cases_smoothed, total_deaths, new_deaths, new_deaths_smoothed ) in zip( dateS, *columnS ) ]
+
+# Returns ( countries, days ) of the OWID-shaped data at scale x the real country count (axis "countries") or day count (axis "days").
+def owid_shape_( scale, axis ):
+    return ( scale * OWID_COUNTRIES, OWID_DAYS ) if axis == 'countries' else ( OWID_COUNTRIES, scale * OWID_DAYS )
+
+# Returns the path of a synthetic OWID json file with countries distinct countries of days days each,
+#   writing it one country at a time on first use with that shape.
+def owid_json_( countries, days, rng ):
+    fn = f'{owid_dir}/owid-{countries}x{days}.json'
+    if isfile( fn ):
+        return fn
+    with open( fn, 'w' ) as oFH:
+        oFH.write( '{' )
+        for ( i, code ) in enumerate( codes_( countries ) ):
+            country = { "continent": "Continent", "location": f'Country {code}', "population": float( rng.integers( 10**5, 10**9 ) ),
+                        "data": owid_country_( rng, days ) }
+            oFH.write( f'{"," if i else ""}\n{dumps( code )}: {dumps( country )}' )
+        oFH.write( '\n}' )
+    return fn
+
+# Returns countries nonnegative synthetic Prem-shaped matrices: contacts concentrated near the diagonal (own age group).
+def prem_matrices_( rng, countries ):
+    age = np.arange( STRATA )
+    band = np.exp( -np.abs( age[ :, np.newaxis ] - age[ np.newaxis, : ] ) / 3.0 )
+    return band * rng.gamma( 2.0, 1.0, ( countries, STRATA, STRATA ) )
+
+# Returns countries distinct synthetic codes, of 3 letters or more if there are more countries than 3-letter codes.
+def codes_( countries ):
+    letters = 3
+    while len( ascii_uppercase ) ** letters < countries:
+        letters += 1
+    return [ ''.join( letterS ) for ( _, letterS ) in zip( range( countries ), product( ascii_uppercase, repeat=letters ) ) ]
+
+# Returns the arguments of arrp_countries_make.py.
+def arrp_arguments_():
+    argument = arrp_countries.getArguments().parse_args( [] )
+    for ( name, value ) in name2arrp.items():
+        setattr( argument, name, value )
+    return argument
+
+# Benchmarks the streaming decode of the synthetic OWID json file and name2data_ on each of its countries, as arrp_countries.py reads it.
+def owid_countries_benchmark( scale, axis, repeat, rng ):
+    argument = arrp_arguments_()
+    ( countries, days ) = owid_shape_( scale, axis )
+    fn = owid_json_( countries, days, rng )
+    def f():
+        for ( code, country, dataS ) in owid_countries_( fn ):
+            arrp_countries.name2data_( argument, dataS )
+    return dict( measure_( f, repeat ), items=countries * days, countries=countries, days=days, json_bytes=stat( fn ).st_size )
+
+# Benchmarks building the columnar cache of the synthetic OWID json file.
+def build_owid_cache_benchmark( scale, axis, repeat, rng ):
+    ( countries, days ) = owid_shape_( scale, axis )
+    fn = owid_json_( countries, days, rng )
+    cache_dir = f'{owid_dir}/cache-{countries}x{days}/'
+    def f():
+        build_owid_cache_( fn, cache_dir, stat( fn ) )
+    return dict( measure_( f, repeat ), items=countries * days, countries=countries, days=days )
+
+# Benchmarks points_ on each country of the columnar cache of the synthetic OWID json file, as arrp_countries.py --cache_dir reads it.
+#   The cache is built first if build_owid_cache_ was not benchmarked.
+def owid_cache_countries_benchmark( scale, axis, repeat, rng ):
+    argument = arrp_arguments_()
+    ( countries, days ) = owid_shape_( scale, axis )
+    fn = owid_json_( countries, days, rng )
+    cache_dir = f'{owid_dir}/cache-{countries}x{days}/'
+    nameS = [ argument.datum_for_threshold, argument.new_cases ]
+    for _ in owid_cache_countries_( fn, cache_dir, nameS ):
+        pass
+    def f():
+        for ( code, country, column2array ) in owid_cache_countries_( fn, cache_dir, nameS ):
+            arrp_countries.points_( argument, column2array )
+    return dict( measure_( f, repeat ), items=countries * days, countries=countries, days=days )
+
+# Benchmarks the asymptotic regression arrp_ of one series per country, with a point per day, in the OWID shape of scale and axis.
+def arrp_benchmark( scale, axis, repeat, rng ):
+    ( countries, days ) = owid_shape_( scale, axis )
+    x = np.arange( days )
+    pointSS = []
+    for _ in range( countries ):
+        y = np.log( 30.0 ) + rng.uniform( 0.0, 0.2 ) * x * np.exp( -x / ( 0.5 * days ) ) + rng.normal( 0.0, 0.05, days )
+        pointSS.append( ( x, y, np.maximum( y, 1.0 ) ** -0.5 * name2arrp[ "st_dev_factor" ] ) )
+    def f():
+        for ( x, y, error ) in pointSS:
+            arrp_( x, y, error )
+    return dict( measure_( f, repeat ), items=countries * days, countries=countries, days=days )
+
+# Benchmarks the scalar perron_frobenius_eig of scale x PREM_COUNTRIES matrices.
+def perron_frobenius_eig_benchmark( scale, axis, repeat, rng ):
+    matrix0S = prem_matrices_( rng, scale * PREM_COUNTRIES )
+    def f():
+        for matrix0 in matrix0S:
+            prem_matrices_to_pf_eigenvalue.perron_frobenius_eig( matrix0 )
+    return dict( measure_( f, repeat ), items=len( matrix0S ) )
+
+# Benchmarks the batched eigenvalues of scale x PREM_COUNTRIES matrices and their make excludes, as in pf_eigenvalue.csv.
+def perron_frobenius_eigvals_benchmark( scale, axis, repeat, rng ):
+    matrix0S = prem_matrices_( rng, scale * PREM_COUNTRIES )
+    codeS = codes_( len( matrix0S ) )
+    argument = prem_matrices_to_pf_eigenvalue.getArguments().parse_args( [ '-e', str( excludes ) ] )
+    argument.odir = None
+    def f():
+        prem_matrices_to_pf_eigenvalue.pf_eigenvalue_( argument, codeS, codeS, matrix0S )
+    return dict( measure_( f, repeat ), items=len( matrix0S ) * ( 1 + len( excludes ) ) )
+
+# Benchmarks the exclusion sweep over every prefix and contiguous band of strata for scale x PREM_COUNTRIES matrices.
+def pf_eigenvalue_sweep_benchmark( scale, axis, repeat, rng ):
+    matrix0S = prem_matrices_( rng, scale * PREM_COUNTRIES )
+    codeS = codes_( len( matrix0S ) )
+    excludeS = sweep_excludes( 'prefixes,bands', STRATA )
+    def f():
+        pf_eigenvalue_sweep( codeS, codeS, matrix0S, excludeS )
+    return dict( measure_( f, repeat ), items=len( matrix0S ) * len( excludeS ) )
+
+# Benchmarks the r0_arrp joins and R0 (without Monte Carlo draws) for scale x R0_COUNTRIES countries.
+def r0_arrp_benchmark( scale, axis, repeat, rng ):
+    countries = scale * R0_COUNTRIES
+    codeS = codes_( countries )
+    df_code = pd.DataFrame( { 'Region Name': 'Region', 'Sub-region Name': 'Sub-region', 'ISO-alpha3 Code': codeS } )
+    df_eigenvalue = pd.DataFrame( { 'ISO-alpha3 Code': codeS, 'country': codeS, 'pf_eigenvalue': rng.uniform( 5.0, 20.0, countries ) } )
+    df_slope = pd.DataFrame( { 'code': codeS[ ::-1 ], 'country': codeS[ ::-1 ], 'slope': rng.normal( 0.05, 0.05, countries ),
+                               'error': rng.uniform( 0.001, 0.01, countries ), 'number_of_points': 30,
+                               'start_date': '2020-03-01', 'end_date': '2020-03-30' } )
+    with open( f'{pipeline}4_R0_ARRP/Data/generation_time.json' ) as iFH:
+        gammas = load( iFH )
+    argument = r0_arrp.getArguments().parse_args( [] )
+    argument.odir = None
+    def f():
+        r0_arrp.r0_( argument, gammas, df_code, df_eigenvalue, df_slope )
+    return dict( measure_( f, repeat ), items=countries * len( gammas ) )
+
+name2benchmark = { "owid_countries_": owid_countries_benchmark,
+                   "build_owid_cache_": build_owid_cache_benchmark,
+                   "owid_cache_countries_": owid_cache_countries_benchmark,
+                   "arrp_": arrp_benchmark,
+                   "perron_frobenius_eig": perron_frobenius_eig_benchmark,
+                   "perron_frobenius_eigvals": perron_frobenius_eigvals_benchmark,
+                   "pf_eigenvalue_sweep": pf_eigenvalue_sweep_benchmark,
+                   "r0_arrp": r0_arrp_benchmark }
+
+# Axes scaled by each benchmark besides the countries
+name2axes = { name: [ 'countries', 'days' ] for name in [ "owid_countries_", "build_owid_cache_", "owid_cache_countries_", "arrp_" ] }
+
+def getArguments():
+    parser = argparse.ArgumentParser(description='The program benchmarks the pipeline steps on synthetic data and appends the results to a json file.\n')
+    parser.add_argument("-s", "--scales", dest="scales", default="1,10,100", # multiples of the real country and day counts
+                        help="SCALES", metavar="SCALES")
+    parser.add_argument("-b", "--benchmarks", dest="benchmarks", default=None, # comma-separated benchmark names; all by default
+                        help="BENCHMARKS", metavar="BENCHMARKS")
+    parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=3, # timings per benchmark; the best is kept
+                        help="REPEAT", metavar="REPEAT")
+    parser.add_argument("--seed", dest="seed", type=int, default=0, # seed of the synthetic data
+                        help="SEED", metavar="SEED")
+    parser.add_argument("-t", "--tmp_dir", dest="tmp_dir", default=None, # directory for the temporary synthetic json files (up to about 1 GB each at 100x); the system's by default
+                        help="TMP_DIRECTORY", metavar="TMP_DIRECTORY")
+    parser.add_argument("-o", "--ofn", dest="ofn", default=ofn, # json file of the benchmark runs
+                        help="OUTPUT_FN", metavar="OUTPUT_FN")
+    return parser
+
+if __name__ == "__main__":
+    main()
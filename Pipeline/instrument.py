@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Lightweight instrumentation shared by the pipeline steps.
+
+A step wraps its work in instrumented( step, trace_fn, profile ) and marks stages with span( name, items=... ).
+Each span records its wall-clock start, duration, item count, attributes and the peak RSS of the process so far.
+The spans are written to trace_fn on exit: as a Chrome trace (chrome://tracing, Perfetto) if it ends with ".json",
+  else as JSON lines, one span per line followed by a summary line with the counts.
+--profile cprofile or --profile tracemalloc also wraps the step in cProfile or tracemalloc,
+  printing the hot spots and (for cProfile) dumping [step].prof for pstats.
+Without trace_fn or profile, spans cost two clock reads each.
+"""
+
+# Import libraries
+import cProfile
+import pstats
+import tracemalloc
+from os import getpid
+from time import time
+from json import dumps
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+TOP = 25 # hot spots printed by --profile
+
+state = { "step": None, "spanS": [], "name2count": dict() }
+
+# Adds the --trace and --profile arguments shared by the step scripts to parser.
+def add_arguments( parser ):
+    parser.add_argument("--trace", dest="trace", default=None, # *.json writes a Chrome trace of the spans; any other name writes JSON lines
+                        help="TRACE_FN", metavar="TRACE_FN")
+    parser.add_argument("--profile", dest="profile", default=None, choices=["cprofile", "tracemalloc"], # wraps the step in a profiler
+                        help="PROFILE", metavar="PROFILE")
+    return parser
+
+# Returns the peak resident set size of the process in bytes, or None where it is unavailable.
+def peak_rss():
+    if resource is None:
+        return None
+    return resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss * 1024 # kilobytes on Linux
+
+# Runs the body as step, writing the spans to trace_fn and profiling the body if profile is given.
+@contextmanager
+def instrumented( step, trace_fn=None, profile=None ):
+    state[ "step" ] = step
+    state[ "spanS" ] = []
+    state[ "name2count" ] = dict()
+    profiler = None
+    if profile == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == 'tracemalloc':
+        tracemalloc.start()
+    try:
+        with span( step ):
+            yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats( f'{step}.prof' )
+            print( f'-- cProfile hot spots (all in "{step}.prof") --', flush=True )
+            pstats.Stats( profiler ).sort_stats( 'cumulative' ).print_stats( TOP )
+        elif profile == 'tracemalloc':
+            ( _, peak ) = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            print( f'-- tracemalloc peak {peak} bytes; largest allocations by line --', flush=True )
+            for stat in snapshot.statistics( 'lineno' )[ :TOP ]:
+                print( stat, flush=True )
+        if trace_fn is not None:
+            write_trace( trace_fn )
+
+# Records the body as a span called name; attributes (e.g., items=len( codeS ), code=code) are stored with it.
+@contextmanager
+def span( name, **attributes ):
+    start = time()
+    try:
+        yield
+    finally:
+        record( name, start, time() - start, **attributes )
+
+# Records a span: name, wall-clock start (secs since the epoch) and seconds.
+#   For a span measured in a worker process, attributes pid and peak_rss replace those of this process.
+def record( name, start, seconds, **attributes ):
+    s = dict( name=name, start=start, seconds=seconds, peak_rss=peak_rss(), pid=getpid() )
+    s.update( attributes )
+    state[ "spanS" ].append( s )
+    if "items" in attributes:
+        count( name, attributes[ "items" ] )
+
+# Adds items to the count of name.
+def count( name, items=1 ):
+    state[ "name2count" ][ name ] = state[ "name2count" ].get( name, 0 ) + items
+
+# Writes the spans to trace_fn as a Chrome trace (*.json) or JSON lines.
+def write_trace( trace_fn ):
+    spanS = sorted( state[ "spanS" ], key=lambda s: s[ "start" ] )
+    with open( trace_fn, 'w' ) as oFH:
+        if trace_fn.endswith( '.json' ):
+            # Complete events ("ph": "X") with microsecond timestamps; attributes appear as args.
+            eventS = [ { "name": s[ "name" ], "cat": state[ "step" ], "ph": "X", "ts": int( s[ "start" ] * 1e6 ), "dur": int( s[ "seconds" ] * 1e6 ),
+                         "pid": s[ "pid" ], "tid": s[ "pid" ],
+                         "args": { key: value for ( key, value ) in s.items() if key not in ( "name", "start", "seconds", "pid" ) } } for s in spanS ]
+            oFH.write( dumps( { "traceEvents": eventS, "displayTimeUnit": "ms" } ) )
+        else:
+            for s in spanS:
+                oFH.write( dumps( dict( step=state[ "step" ], **s ) ) + '\n' )
+            oFH.write( dumps( { "step": state[ "step" ], "counts": state[ "name2count" ], "peak_rss": peak_rss() } ) + '\n' )
@@ -1,17 +1,128 @@
 #!/usr/bin/env python
 
-from os import system, chdir
+import argparse
+from os import system, walk
+from os.path import exists, isfile, join
+from hashlib import sha256
+from json import load, dump
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 log = f'make.log'
+manifest = f'make_manifest.json' # content hashes of the inputs and outputs of each step's last run
 
 directory2make = {'1_Prem_Matrices_to_df/':'prem_matrices_to_df_make.py',
                   '2_ARRP/':'arrp_countries_make.py',
                   '3_Prem_Matrices_to_PF_Eigenvalue/':'prem_matrices_to_pf_eigenvalue_make.py',
                   '4_R0_ARRP/':'r0_arrp_make.py'}
 
-with open( log, "w" ) as lfh:
-    for ( directory, make ) in directory2make.items():
-        print( directory, file=lfh )
-        chdir( f'{directory}Executable/' )
-        system( f'python {directory2make[directory]}' )
-        chdir( '../../' )
+# Files read by each step besides its own Data/ and Executable/ (code and parameters), e.g., the shared instrument.py.
+#   An input in another step's Output/ makes the step wait for that step.
+directory2inputs = {'1_Prem_Matrices_to_df/':['instrument.py'],
+                    '2_ARRP/':['instrument.py'],
+                    '3_Prem_Matrices_to_PF_Eigenvalue/':['instrument.py',
+                                                         '1_Prem_Matrices_to_df/Data/UNSDMethodology.csv',
+                                                         '1_Prem_Matrices_to_df/Output/'],
+                    '4_R0_ARRP/':['instrument.py',
+                                  '1_Prem_Matrices_to_df/Data/UNSDMethodology.csv',
+                                  '1_Prem_Matrices_to_df/Output/prem_matrices.npy',
+                                  '1_Prem_Matrices_to_df/Output/prem_matrices.json',
+                                  '3_Prem_Matrices_to_PF_Eigenvalue/Executable/prem_matrices_to_pf_eigenvalue_sweep.py',
+                                  '2_ARRP/Output/slope.csv',
+                                  '3_Prem_Matrices_to_PF_Eigenvalue/Output/pf_eigenvalue.csv']}
+
+def main():
+    parser = getArguments()
+    argument = parser.parse_args()
+
+    directory2hashes = dict()
+    if isfile( manifest ) and not argument.force:
+        with open( manifest ) as iFH:
+            directory2hashes = load( iFH )
+    directory2upstream = directory2upstream_()
+
+    # Runs each step as soon as its upstream steps finish, so independent steps run at the same time.
+    with open( log, "w" ) as lfh:
+        pendingS = list( directory2make.keys() )
+        doneS = set()
+        failedS = set()
+        future2directory = dict()
+        with ThreadPoolExecutor( max_workers=len( directory2make ) ) as executor:
+            while pendingS or future2directory:
+                for directory in list( pendingS ):
+                    if any( upstream in failedS for upstream in directory2upstream[ directory ] ):
+                        pendingS.remove( directory )
+                        failedS.add( directory )
+                        print( f'{directory} skipped: an upstream step failed', file=lfh, flush=True )
+                    elif all( upstream in doneS for upstream in directory2upstream[ directory ] ):
+                        pendingS.remove( directory )
+                        future = executor.submit( make_, directory, directory2hashes.get( directory ), lfh )
+                        future2directory[ future ] = directory
+                if not future2directory:
+                    continue
+                finishedS, _ = wait( future2directory, return_when=FIRST_COMPLETED )
+                for future in finishedS:
+                    directory = future2directory.pop( future )
+                    hashes = future.result()
+                    if hashes is None:
+                        failedS.add( directory )
+                        directory2hashes.pop( directory, None )
+                    else:
+                        doneS.add( directory )
+                        directory2hashes[ directory ] = hashes
+                    # Records progress after every step, so an interrupted make resumes where it stopped.
+                    with open( manifest, "w" ) as oFH:
+                        dump( directory2hashes, oFH, indent=4, sort_keys=True )
+
+# Runs a step unless its inputs and outputs match the hashes of its last run; returns the new hashes or None on failure.
+#   Each *_make.py exits with the status of its step, so a failed step is never recorded as up to date.
+def make_( directory, hashes, lfh ):
+    inputs = hash_( inputs_( directory ) )
+    if hashes is not None and hashes[ "inputs" ] == inputs and hashes[ "outputs" ] == hash_( [ f'{directory}Output/' ] ):
+        print( f'{directory} up to date', file=lfh, flush=True )
+        return hashes
+    print( directory, file=lfh, flush=True )
+    if system( f'cd {directory}Executable/ && python {directory2make[directory]}' ) != 0:
+        print( f'{directory} failed', file=lfh, flush=True )
+        return None
+    return { "inputs": inputs, "outputs": hash_( [ f'{directory}Output/' ] ) }
+
+# Returns the paths read by a step.
+def inputs_( directory ):
+    return [ f'{directory}Data/', f'{directory}Executable/' ] + directory2inputs[ directory ]
+
+# Returns the steps whose Output/ a step reads.
+def directory2upstream_():
+    directory2upstream = dict()
+    for directory in directory2make.keys():
+        directory2upstream[ directory ] = [ upstream for upstream in directory2make.keys()
+            if upstream != directory and any( path.startswith( f'{upstream}Output/' ) for path in directory2inputs[ directory ] ) ]
+    return directory2upstream
+
+# Returns the SHA-256 hex digest of the names and contents of the files under pathS, ignoring logs and caches.
+def hash_( pathS ):
+    h = sha256()
+    for path in pathS:
+        if isfile( path ):
+            fnS = [ path ]
+        elif exists( path ):
+            fnS = sorted( join( root, fn ) for ( root, dirS, fns ) in walk( path ) if '__pycache__' not in root
+                          for fn in fns if not fn.endswith( '.log' ) )
+        else:
+            fnS = []
+        h.update( f'{path}\n'.encode() )
+        for fn in fnS:
+            hf = sha256()
+            with open( fn, 'rb' ) as iFH:
+                for block in iter( lambda: iFH.read( 1 << 20 ), b'' ):
+                    hf.update( block )
+            h.update( f'{fn}\t{hf.hexdigest()}\n'.encode() )
+    return h.hexdigest()
+
+def getArguments():
+    parser = argparse.ArgumentParser(description='The program runs the pipeline steps whose inputs, parameters or code changed.\n')
+    parser.add_argument("-f", "--force", dest="force", action="store_true", # reruns every step regardless of the manifest
+                        help="FORCE")
+    return parser
+
+if __name__ == "__main__":
+    main()
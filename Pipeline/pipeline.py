@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Runs the whole pipeline in one process, handing each step's frames and arrays to the next in memory.
+
+The parameters are those of the *_make.py scripts; step 2 uses the NumPy regression 'arrp.py', so no file is written
+  unless -w writes each step's usual files to its Output/ directory
+  (and, as r0_arrp_make.py does, appends the run to 4_R0_ARRP/Output/code2r0_history.sqlite).
+"""
+
+# Import libraries
+import argparse
+import sys
+from os.path import abspath, dirname
+from math import sqrt
+from time import time
+
+pipeline = f'{dirname( abspath( __file__ ) )}/'
+for directory in [ '1_Prem_Matrices_to_df/', '2_ARRP/', '3_Prem_Matrices_to_PF_Eigenvalue/', '4_R0_ARRP/' ]:
+    sys.path.insert( 0, f'{pipeline}{directory}Executable' )
+
+import prem_matrices_to_df
+import arrp_countries
+import prem_matrices_to_pf_eigenvalue
+import r0_arrp
+
+code_fn = f'{pipeline}1_Prem_Matrices_to_df/Data/UNSDMethodology.csv'
+
+# Parameters of arrp_countries_make.py
+name2arrp = { "new_cases": "new_cases_smoothed", "st_dev_factor": 1.0/sqrt(7.0), "threshold": 30, "datum_for_threshold": "new_cases_smoothed" }
+
+# Parameters of prem_matrices_to_pf_eigenvalue_make.py
+excludes = [[0],[0,1],[0,1,2],[0,1,2,3],[0,1,2,3,4],[0,1,2,3,4,5],[0,1,2,3,4,5,6],[0,1,2,3,4,5,6,7]]
+
+# Parameters of r0_arrp_make.py; the Prem matrices for --ngm come from step 1 in memory instead of its store
+name2r0 = { "draws": 100000, "ngm": "removals" }
+
+def main():
+    parser = getArguments()
+    argument = parser.parse_args()
+    run( owid_dir=argument.idir, write=argument.write )
+
+# Returns { "prem_matrices", "slope", "pf_eigenvalue", "code2r0" }, the results of the four steps, reading OWID data from owid_dir.
+#   With write, each step also writes its files to its Output/ directory.
+def run( owid_dir=f'{pipeline}2_ARRP/Data', write=False ):
+    # Returns the Output/ directory of a step if the files are written.
+    def odir( directory ):
+        return f'{pipeline}{directory}Output/' if write else None
+    start = time()
+    prem_matrices = prem_matrices_to_df.run( idir=f'{pipeline}1_Prem_Matrices_to_df/Data/', odir=odir( '1_Prem_Matrices_to_df/' ) )
+    print( f'-- Step 1 ended: {time() - start:.2f} secs --', flush=True )
+    slope = arrp_countries.run( idir=owid_dir, odir=odir( '2_ARRP/' ), **name2arrp )
+    print( f'-- Step 2 ended: {time() - start:.2f} secs --', flush=True )
+    pf_eigenvalue = prem_matrices_to_pf_eigenvalue.run( prem_matrices[ "codeS" ], matrix0S=prem_matrices[ "matrix0S" ],
+                                                         odir=odir( '3_Prem_Matrices_to_PF_Eigenvalue/' ), code_fn=code_fn, excludes=excludes )
+    print( f'-- Step 3 ended: {time() - start:.2f} secs --', flush=True )
+    history = f'{odir( "4_R0_ARRP/" )}code2r0_history.sqlite' if write else None
+    code2r0 = r0_arrp.run( slope[ "slope" ], pf_eigenvalue[ "pf_eigenvalue" ], odir=odir( '4_R0_ARRP/' ),
+                           idir=f'{pipeline}4_R0_ARRP/Data/', code_fn=code_fn, history=history,
+                           code2matrix=dict( zip( prem_matrices[ "codeS" ], prem_matrices[ "matrix0S" ] ) ), **name2r0 )
+    print( f'-- Step 4 ended: {time() - start:.2f} secs --', flush=True )
+    return { "prem_matrices": prem_matrices, "slope": slope, "pf_eigenvalue": pf_eigenvalue, "code2r0": code2r0 }
+
+def getArguments():
+    parser = argparse.ArgumentParser(description='The program runs the four pipeline steps in one process.\n')
+    parser.add_argument("-i", "--idir", dest="idir", default=f'{pipeline}2_ARRP/Data', # directory of owid-covid-data.json
+                        help="INPUT_DIRECTORY", metavar="INPUT_DIRECTORY")
+    parser.add_argument("-w", "--write", dest="write", action="store_true", # writes each step's files to its Output/ directory
+                        help="WRITE")
+    return parser
+
+if __name__ == "__main__":
+    main()